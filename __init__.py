@@ -1 +1,7 @@
-from .core._vector import Vector2D, Vector3D
+from .core._vector import Vector2D, Vector3D, Vector2DArray, Vector3DArray
+from .core._transform import Transform
+from .core._spatial import UniformGrid, KDTree
+from .core._pairwise import pairwise_dots, pairwise_distances, pairwise_angles
+from .core._pairwise import iter_pairwise_dots, iter_pairwise_distances, iter_pairwise_angles
+from .core._particles import ParticleSystem, UniformField, Drag, Gravity, Repulsion
+from .core._lazy import lazy, LazyExpression
@@ -0,0 +1,176 @@
+"""
+Benchmarks of the core vector types. The module uses relative imports, run it as
+python -m custom_utils.core._benchmarks to print the results.
+"""
+import tracemalloc
+from timeit import timeit
+
+import numpy as np
+
+from ._vector import Vector2D, Vector2DArray
+from ._lazy import lazy
+
+
+class _LegacyVector2D:
+    """ Copy of the original __dict__ based Vector2D, used as a reference. """
+
+    def __init__(self, x, y):
+
+        self._x = x
+        self._y = y
+
+        self._abs = None
+
+    @property
+    def x(self):
+
+        return self._x
+
+    @property
+    def y(self):
+
+        return self._y
+
+    def __add__(self, second):
+
+        return _LegacyVector2D(self.x + second.x, self.y + second.y)
+
+    def __mul__(self, scalar):
+
+        return _LegacyVector2D(self.x * scalar, self.y * scalar)
+
+    def __abs__(self):
+
+        if self._abs is None:
+            self._abs = (self.x**2 + self.y**2)**0.5
+
+        return self._abs
+
+
+def _allocated_bytes(factory, n):
+    """ Returns bytes held by n objects created by factory(i), measured with tracemalloc. """
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del objects
+    return after - before
+
+
+def benchmark_vector_memory(n=100_000):
+    """
+    Measures memory used by n 2D vectors of the legacy class, the slotted Vector2D
+    and plain tuples. Returns dict of bytes per vector (the list itself included).
+    """
+
+    factories = {
+        "legacy Vector2D": lambda i: _LegacyVector2D(float(i), float(i)),
+        "slotted Vector2D": lambda i: Vector2D(float(i), float(i)),
+        "tuple": lambda i: (float(i), float(i)),
+    }
+
+    return {name: _allocated_bytes(factory, n) / n for name, factory in factories.items()}
+
+
+def benchmark_vector_throughput(number=100_000):
+    """
+    Times a small arithmetic expression (a + b) * 2 followed by abs() on the legacy
+    and the slotted class. Returns dict of seconds per evaluation.
+    """
+
+    results = {}
+
+    for name, cls in (("legacy Vector2D", _LegacyVector2D), ("slotted Vector2D", Vector2D)):
+        a = cls(1.0, 2.0)
+        b = cls(3.0, 4.0)
+        results[name] = timeit(lambda: abs((a + b) * 2), number=number) / number
+
+    return results
+
+
+def _peak_bytes(function):
+    """ Returns peak memory allocated while running function, measured with tracemalloc. """
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak
+
+
+def benchmark_lazy_evaluation(n=1_000_000, number=10):
+    """
+    Compares eager and lazy evaluation of (a - b).normalized() * k + c over batches of n
+    vectors. Returns dict of (peak temporary memory in bytes, seconds per evaluation).
+    """
+
+    rng = np.random.default_rng(0)
+    a, b, c = (Vector2DArray(*rng.random((2, n))) for _ in range(3))
+    k = 2.0
+
+    expressions = {
+        "eager": lambda: (a - b).normalized() * k + c,
+        "lazy": lambda: ((lazy(a) - b).normalized() * k + c).evaluate(),
+    }
+
+    return {name: (_peak_bytes(expression), timeit(expression, number=number) / number)
+            for name, expression in expressions.items()}
+
+
+def check_lazy_evaluation(n=1000):
+    """
+    Compares results of lazy and eager evaluation of expressions covering scalars, scalar
+    vectors and batches, including unary operations on non-vector values. Returns dict
+    of whether they agree, by expression.
+    """
+
+    rng = np.random.default_rng(0)
+    a, b, c = (Vector2DArray(*rng.random((2, n))) for _ in range(3))
+    v = Vector2D(3, 4)
+    k = 2.0
+
+    cases = {
+        "(a - b).normalized() * k + c": (
+            lambda: ((lazy(a) - b).normalized() * k + c).evaluate(),
+            lambda: (a - b).normalized() * k + c),
+        "-(a @ b)": (lambda: (-(lazy(a) @ b)).evaluate(), lambda: -(a @ b)),
+        "abs(-3.0)": (lambda: abs(lazy(-3.0)).evaluate(), lambda: abs(-3.0)),
+        "-abs(v)": (lambda: (-abs(lazy(v))).evaluate(), lambda: -abs(v)),
+        "abs(-a)": (lambda: abs(-lazy(a)).evaluate(), lambda: abs(-a)),
+    }
+
+    results = {}
+    for name, (lazy_expression, eager_expression) in cases.items():
+        lazy_result, eager_result = lazy_expression(), eager_expression()
+        results[name] = (isinstance(lazy_result, np.ndarray) == isinstance(eager_result, np.ndarray)
+                         and np.shape(lazy_result) == np.shape(eager_result)
+                         and np.allclose(lazy_result, eager_result))
+
+    return results
+
+
+def main():
+
+    print("Memory per vector [B]")
+    for name, size in benchmark_vector_memory().items():
+        print(f"    {name:20}{size:10.1f}")
+
+    print("Throughput of abs((a + b) * 2) [us]")
+    for name, seconds in benchmark_vector_throughput().items():
+        print(f"    {name:20}{seconds * 1e6:10.3f}")
+
+    print("(a - b).normalized() * k + c, 10^6 vectors [MB of temporaries, ms]")
+    for name, (peak, seconds) in benchmark_lazy_evaluation().items():
+        print(f"    {name:20}{peak / 1e6:10.1f}{seconds * 1e3:10.1f}")
+
+    print("Lazy evaluation agrees with eager")
+    for name, agrees in check_lazy_evaluation().items():
+        print(f"    {name:30}{agrees!s:>10}")
+
+
+if __name__ == '__main__':
+    main()
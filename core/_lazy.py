@@ -0,0 +1,343 @@
+"""
+Opt-in lazy evaluation of vector arithmetic. lazy(v) wraps a vector (scalar or batch) or
+a scalar (number or array), operations on the wrapper only record an expression graph, and
+evaluate() computes it in one pass. Equal subexpressions are evaluated once (e.g. abs(a)
+in a.normalized() * abs(a)) and intermediate arrays of batches are reused as output
+buffers of the following operations instead of allocating new temporaries.
+
+Usage
+-----
+expression = (lazy(a) - b).normalized() * k + c
+result = expression.evaluate()
+"""
+import numpy as np
+
+from ._vector import Vector2D, Vector3D, _VectorArray
+
+
+class LazyExpression:
+    """
+    Node of the expression graph, created by lazy() and operations on LazyExpressions.
+    Operands that are not LazyExpressions are wrapped automatically.
+    """
+
+    def __init__(self, op, args, key, is_vector):
+
+        self.op = op
+        self.args = args
+        self.key = key
+        self.is_vector = is_vector
+
+    @classmethod
+    def _node(cls, op, *args, is_vector):
+
+        args = tuple(lazy(arg) for arg in args)
+        return cls(op, args, (op,) + tuple(arg.key for arg in args), is_vector)
+
+    def __add__(self, second):
+
+        second = lazy(second)
+        return self._node("add", self, second, is_vector=self.is_vector)
+
+    def __radd__(self, first):
+
+        return lazy(first) + self
+
+    def __sub__(self, second):
+
+        second = lazy(second)
+        return self._node("sub", self, second, is_vector=self.is_vector)
+
+    def __rsub__(self, first):
+
+        return lazy(first) - self
+
+    def __mul__(self, second):
+
+        second = lazy(second)
+        if self.is_vector and second.is_vector:
+            raise TypeError("Vectors can only be multiplied by scalars, use @ for dot product.")
+
+        if second.is_vector:
+            return self._node("mul", second, self, is_vector=True)
+        return self._node("mul", self, second, is_vector=self.is_vector)
+
+    def __rmul__(self, first):
+
+        return lazy(first) * self
+
+    def __truediv__(self, second):
+
+        return self._node("div", self, second, is_vector=self.is_vector)
+
+    def __rtruediv__(self, first):
+
+        return lazy(first) / self
+
+    def __matmul__(self, second):
+
+        return self._node("dot", self, second, is_vector=False)
+
+    def __rmatmul__(self, first):
+
+        return lazy(first) @ self
+
+    def __neg__(self):
+
+        return self._node("neg", self, is_vector=self.is_vector)
+
+    def __abs__(self):
+
+        if self.is_vector:
+            return self._node("abs", self, is_vector=False)
+        return self._node("fabs", self, is_vector=False)
+
+    def normalized(self):
+
+        return self / abs(self)
+
+    def normal(self):
+
+        return self._node("normal", self, is_vector=True)
+
+    def evaluate(self):
+        """
+        Computes the expression. Returns the type of its leaves: scalar vector, vector batch,
+        number or ndarray.
+        """
+
+        consumers = {}
+        nodes = {}
+        self._count_consumers(consumers, nodes)
+
+        values = {}
+        result, owned = self._evaluate(values, consumers)
+
+        if self.is_vector:
+            return _to_vector(result, owned, self._vector_type(nodes))
+        return result
+
+    def _count_consumers(self, consumers, nodes):
+
+        if self.key in nodes:
+            return
+        nodes[self.key] = self
+        if self.op == "leaf":
+            return
+
+        for arg in self.args:
+            consumers[arg.key] = consumers.get(arg.key, 0) + 1
+            arg._count_consumers(consumers, nodes)
+
+    def _vector_type(self, nodes):
+
+        vector_leaves = [node.args[0] for node in nodes.values()
+                         if node.op == "leaf" and node.is_vector]
+        batches = [leaf for leaf in vector_leaves if isinstance(leaf, _VectorArray)]
+
+        return type(batches[0] if batches else vector_leaves[0])
+
+    def _evaluate(self, values, consumers):
+        """
+        Returns (value, owned), where vector values are tuples of components and owned means
+        the arrays in value are temporaries that can be overwritten once all consumers used them.
+        """
+
+        if self.key in values:
+            return values[self.key]
+
+        if self.op == "leaf":
+            result = _to_components(self.args[0]), False
+        else:
+            evaluated = [arg._evaluate(values, consumers) for arg in self.args]
+
+            # an operand can be overwritten only after all its other consumers were computed
+            operands = []
+            for arg, (value, owned) in zip(self.args, evaluated):
+                consumers[arg.key] -= 1
+                if consumers[arg.key] == 0:
+                    # not needed anymore, its memory can be freed or reused
+                    values.pop(arg.key, None)
+                operands.append((value, owned and consumers[arg.key] == 0))
+
+            result = _OPERATIONS[self.op](*operands)
+
+        values[self.key] = result
+        return result
+
+    def __repr__(self):
+
+        if self.op == "leaf":
+            return f"lazy({self.args[0]!r})"
+        return f"{self.op}({', '.join(map(repr, self.args))})"
+
+
+def lazy(value):
+    """ Wraps vector, vector batch, number or array into LazyExpression, see module docstring. """
+
+    if isinstance(value, LazyExpression):
+        return value
+
+    is_vector = isinstance(value, (_VectorArray, Vector2D, Vector3D))
+    # leaves are the same subexpression only if they are the same object
+    return LazyExpression("leaf", (value,), ("leaf", id(value)), is_vector)
+
+
+def _to_components(value):
+
+    if isinstance(value, _VectorArray):
+        return tuple(value._data)
+    if isinstance(value, (Vector2D, Vector3D)):
+        return value.get()
+    return value
+
+
+def _to_vector(components, owned, vector_type):
+
+    if not issubclass(vector_type, _VectorArray):
+        return vector_type(*(float(c) for c in components))
+
+    block = _block_of(components)
+    if owned and block is not None:
+        return vector_type._from_data(block)
+
+    shape = np.broadcast_shapes(*(np.shape(c) for c in components))
+    return vector_type(*(np.broadcast_to(c, shape) for c in components))
+
+
+def _block_of(components):
+    """ Returns (dim, N) array whose rows are the components, None if there is not one. """
+
+    block = getattr(components[0], "base", None)
+    if block is None or block.shape[:1] != (len(components),) or block.ndim != 2:
+        return None
+
+    for row, component in zip(block, components):
+        if not isinstance(component, np.ndarray) or component.base is not block \
+                or row.ctypes.data != component.ctypes.data:
+            return None
+
+    return block
+
+
+def _apply(ufunc, first, second=None, out=None):
+    """
+    Applies ufunc to (value, reusable) operands, writing into a reusable ndarray operand
+    of the right shape if there is one, into out otherwise.
+    """
+
+    arrays = [first] if second is None else [first, second]
+    values = [value for value, _ in arrays]
+
+    if any(reusable for _, reusable in arrays) or out is not None:
+        shape = np.broadcast_shapes(*(np.shape(value) for value in values))
+
+        for value, reusable in arrays:
+            if reusable and isinstance(value, np.ndarray) and value.shape == shape \
+                    and value.dtype == np.float64:
+                return ufunc(*values, out=value)
+
+        if out is not None and out.shape == shape:
+            return ufunc(*values, out=out)
+
+    return ufunc(*values)
+
+
+def _new_block(operands):
+    """
+    Returns (dim, N) buffer for results of componentwise operation on operands (list of
+    (value, reusable) per component), or a list of Nones if the operands can be reused
+    or the results are not arrays. Results stored as rows of one block can be wrapped
+    into a vector batch without copying.
+    """
+
+    if any(reusable for component in operands for _, reusable in component):
+        return [None] * len(operands)
+
+    shape = np.broadcast_shapes(*(np.shape(value) for component in operands
+                                  for value, _ in component))
+    if not shape:
+        return [None] * len(operands)
+
+    return np.empty((len(operands),) + shape)
+
+
+def _componentwise(ufunc):
+
+    def operation(first, second=None):
+
+        first_value, first_reusable = first
+
+        if not isinstance(first_value, tuple):
+            # number or array, not components of a vector
+            return _apply(ufunc, first, second), True
+
+        if second is None:
+            operands = [[(c, first_reusable)] for c in first_value]
+        else:
+            second_value, second_reusable = second
+
+            if isinstance(second_value, tuple):
+                pairs = zip(first_value, second_value)
+            else:
+                # a scalar operand shared by all components must not be overwritten
+                pairs = ((c, second_value) for c in first_value)
+                second_reusable = False
+
+            operands = [[(a, first_reusable), (b, second_reusable)] for a, b in pairs]
+
+        outs = _new_block(operands)
+        return tuple(_apply(ufunc, *component, out=out)
+                     for component, out in zip(operands, outs)), True
+
+    return operation
+
+
+def _dot(first, second):
+
+    (first_value, first_reusable), (second_value, second_reusable) = first, second
+
+    first_block, second_block = _block_of(first_value), _block_of(second_value)
+    if first_block is not None and second_block is not None:
+        # no temporaries for the products
+        return np.einsum("ij,ij->j", first_block, second_block), True
+
+    result = None
+    for a, b in zip(first_value, second_value):
+        product = _apply(np.multiply, (a, first_reusable), (b, second_reusable))
+        result = product if result is None else _apply(np.add, (result, True), (product, True))
+
+    return result, True
+
+
+def _abs(vector):
+
+    value, reusable = vector
+    # squares are written into the operand's buffers only if nobody else needs them
+    squares = _dot((value, reusable), (value, False))
+    return _apply(np.sqrt, squares), True
+
+
+def _normal(vector):
+
+    (x, y), reusable = vector
+    # y is copied unless it is a temporary, the result must not alias a buffer that
+    # can be overwritten by another consumer
+    operands = [[(y, reusable)], [(x, reusable)]]
+    outs = _new_block(operands)
+
+    return (_apply(np.positive, *operands[0], out=outs[0]),
+            _apply(np.negative, *operands[1], out=outs[1])), True
+
+
+_OPERATIONS = {
+    "add": _componentwise(np.add),
+    "sub": _componentwise(np.subtract),
+    "mul": _componentwise(np.multiply),
+    "div": _componentwise(np.true_divide),
+    "neg": _componentwise(np.negative),
+    "fabs": _componentwise(np.absolute),
+    "dot": _dot,
+    "abs": _abs,
+    "normal": _normal,
+}
@@ -0,0 +1,131 @@
+"""
+All-pairs distance, dot product and angle matrices between two sets of vectors. The matrices
+are computed in square tiles of block_size x block_size, so the temporary memory is bounded
+by the tile size. The iter_* variants yield the tiles one by one instead of assembling the
+whole matrix, e.g. for streaming it to disk. Vector sets can be anything accepted by
+the spatial indices: scalar vectors, vector batches or (N, dim) arrays.
+"""
+import numpy as np
+
+from ._vector import _as_points
+
+
+def _dot_tile(a, b):
+
+    return a @ b.T
+
+
+def _distance_tile(a, b):
+
+    # per component accumulation instead of |a|^2 + |b|^2 - 2ab, which loses precision
+    # for close points
+    tile = np.zeros((len(a), len(b)))
+    for component in range(a.shape[1]):
+        difference = a[:, component, np.newaxis] - b[:, component]
+        tile += difference * difference
+
+    return np.sqrt(tile, out=tile)
+
+
+def _angle_tile(a, b):
+
+    # atan2(|a x b|, a.b) stays accurate near 0 and pi, where arccos of the normalized dot
+    # product loses precision or leaves its domain due to rounding
+    if a.shape[1] == 2:
+        cross_norm = np.abs(a[:, 0, np.newaxis] * b[:, 1] - a[:, 1, np.newaxis] * b[:, 0])
+    else:
+        cross_norm = np.zeros((len(a), len(b)))
+        for i, j in ((1, 2), (2, 0), (0, 1)):
+            component = a[:, i, np.newaxis] * b[:, j] - a[:, j, np.newaxis] * b[:, i]
+            cross_norm += component * component
+        np.sqrt(cross_norm, out=cross_norm)
+
+    return np.arctan2(cross_norm, a @ b.T)
+
+
+def _iter_tiles(kernel, a, b, block_size):
+
+    a = _as_points(a)
+    b = a if b is None else _as_points(b, a.shape[1] or None)
+
+    for row in range(0, len(a), block_size):
+        rows = slice(row, min(row + block_size, len(a)))
+
+        for column in range(0, len(b), block_size):
+            columns = slice(column, min(column + block_size, len(b)))
+            yield rows, columns, kernel(a[rows], b[columns])
+
+
+def _assemble(tiles, a, b, out):
+
+    n = len(_as_points(a))
+    m = n if b is None else len(_as_points(b))
+
+    if out is None:
+        out = np.empty((n, m))
+    elif out.shape != (n, m):
+        raise ValueError(f"Output buffer has wrong shape, it is supposed to be {(n, m)}.")
+
+    for rows, columns, tile in tiles:
+        out[rows, columns] = tile
+
+    return out
+
+
+def iter_pairwise_dots(a, b=None, block_size=1024):
+    """
+    Yields (rows, columns, tile) where rows and columns are slices into the full N x M matrix
+    of dot products a[i] @ b[j] and tile is its block. If b is None, b = a.
+    """
+
+    return _iter_tiles(_dot_tile, a, b, block_size)
+
+
+def iter_pairwise_distances(a, b=None, block_size=1024):
+    """
+    Yields (rows, columns, tile) where rows and columns are slices into the full N x M matrix
+    of euclidean distances |a[i] - b[j]| and tile is its block. If b is None, b = a.
+    """
+
+    return _iter_tiles(_distance_tile, a, b, block_size)
+
+
+def iter_pairwise_angles(a, b=None, deg=False, block_size=1024):
+    """
+    Yields (rows, columns, tile) where rows and columns are slices into the full N x M matrix
+    of angles between a[i] and b[j] and tile is its block. Angles are in [0, pi] (radians
+    by default, degrees if deg is True), angle with a zero vector is 0. If b is None, b = a.
+    """
+
+    tiles = _iter_tiles(_angle_tile, a, b, block_size)
+    if not deg:
+        return tiles
+
+    return ((rows, columns, np.degrees(tile, out=tile)) for rows, columns, tile in tiles)
+
+
+def pairwise_dots(a, b=None, block_size=1024, out=None):
+    """
+    Returns N x M matrix of dot products a[i] @ b[j], see iter_pairwise_dots.
+    The result is written into out if passed, which can be a numpy.memmap for large N and M.
+    """
+
+    return _assemble(iter_pairwise_dots(a, b, block_size), a, b, out)
+
+
+def pairwise_distances(a, b=None, block_size=1024, out=None):
+    """
+    Returns N x M matrix of euclidean distances |a[i] - b[j]|, see iter_pairwise_distances.
+    The result is written into out if passed, which can be a numpy.memmap for large N and M.
+    """
+
+    return _assemble(iter_pairwise_distances(a, b, block_size), a, b, out)
+
+
+def pairwise_angles(a, b=None, deg=False, block_size=1024, out=None):
+    """
+    Returns N x M matrix of angles between a[i] and b[j], see iter_pairwise_angles.
+    The result is written into out if passed, which can be a numpy.memmap for large N and M.
+    """
+
+    return _assemble(iter_pairwise_angles(a, b, deg, block_size), a, b, out)
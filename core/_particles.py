@@ -0,0 +1,357 @@
+import numpy as np
+
+from ._vector import _as_points
+from ._spatial import KDTree
+
+
+class ParticleSystem:
+    """
+    System of N particles in 2D or 3D integrated with array-backed state. Positions and
+    velocities are (N, dim) ndarrays updated in place, so drawing code (e.g. qt.Canvas.redraw)
+    can keep a reference to self.positions and only read it.
+
+    Parameters
+    ----------
+    positions : scalar vectors, vector batch or (N, dim) array-like
+    velocities : None or the same as positions
+        Zero if None.
+    masses : float or N-length sequence
+    forces : sequence of callables
+        Force kernels, kernel(positions, velocities, masses) returns (N, dim) array of forces.
+        See UniformField, Drag, Gravity and Repulsion.
+    integrator : "verlet", "rk4" or "euler"
+        Velocity Verlet, classic Runge-Kutta 4 or symplectic Euler.
+    copy : bool
+        If False, float ndarrays and vector batches (e.g. made by Vector2DArray.from_buffer)
+        passed as positions and velocities are used directly and updated in place.
+    """
+
+    def __init__(self, positions, velocities=None, masses=1, forces=(), integrator="verlet",
+                 copy=True):
+
+        self.positions = _as_points(positions)
+        dim = self.positions.shape[1]
+
+        if velocities is None:
+            self.velocities = np.zeros_like(self.positions)
+        else:
+            self.velocities = _as_points(velocities, dim)
+
+        if copy:
+            self.positions = self.positions.copy()
+            self.velocities = self.velocities.copy()
+
+        self.masses = np.broadcast_to(np.asarray(masses, dtype=float), len(self.positions)).copy()
+        self.forces = list(forces)
+
+        if integrator not in _INTEGRATORS:
+            raise ValueError(f"Unknown integrator {integrator}, use one of {list(_INTEGRATORS)}.")
+        self.integrator = integrator
+
+        self.t = 0
+        self._acceleration = None
+
+    def accelerations(self, positions=None, velocities=None):
+        """ Returns accelerations given by the force kernels, for the current state by default. """
+
+        positions = self.positions if positions is None else positions
+        velocities = self.velocities if velocities is None else velocities
+
+        total = np.zeros_like(positions)
+        for force in self.forces:
+            total += force(positions, velocities, self.masses)
+
+        return total / self.masses[:, np.newaxis]
+
+    def step(self, dt, n=1):
+        """ Advances the system n times by dt. """
+
+        integrate = _INTEGRATORS[self.integrator]
+        for _ in range(n):
+            integrate(self, dt)
+            self.t += dt
+
+    def reset(self):
+        """ Has to be called after positions, velocities, masses or forces were changed outside. """
+
+        self._acceleration = None
+
+    def kinetic_energy(self):
+
+        return 0.5 * np.sum(self.masses * np.sum(self.velocities**2, axis=1))
+
+
+def _velocity_verlet(system, dt):
+
+    if system._acceleration is None:
+        system._acceleration = system.accelerations()
+
+    acceleration = system._acceleration
+    system.positions += system.velocities * dt + 0.5 * acceleration * dt**2
+
+    new_acceleration = system.accelerations()
+    system.velocities += 0.5 * (acceleration + new_acceleration) * dt
+    system._acceleration = new_acceleration
+
+
+def _symplectic_euler(system, dt):
+
+    system.velocities += system.accelerations() * dt
+    system.positions += system.velocities * dt
+
+
+def _rk4(system, dt):
+
+    x, v = system.positions, system.velocities
+
+    k1x, k1v = v, system.accelerations(x, v)
+    k2x = v + 0.5 * dt * k1v
+    k2v = system.accelerations(x + 0.5 * dt * k1x, k2x)
+    k3x = v + 0.5 * dt * k2v
+    k3v = system.accelerations(x + 0.5 * dt * k2x, k3x)
+    k4x = v + dt * k3v
+    k4v = system.accelerations(x + dt * k3x, k4x)
+
+    x += dt / 6 * (k1x + 2 * k2x + 2 * k3x + k4x)
+    v += dt / 6 * (k1v + 2 * k2v + 2 * k3v + k4v)
+
+
+_INTEGRATORS = {
+    "verlet": _velocity_verlet,
+    "rk4": _rk4,
+    "euler": _symplectic_euler,
+}
+
+
+class UniformField:
+    """ Force m * g, e.g. homogeneous gravity. g is a dim-sequence. """
+
+    def __init__(self, g):
+
+        self.g = np.asarray(g, dtype=float)
+
+    def __call__(self, positions, velocities, masses):
+
+        return masses[:, np.newaxis] * self.g
+
+
+class Drag:
+    """ Linear drag force -coefficient * v. """
+
+    def __init__(self, coefficient):
+
+        self.coefficient = coefficient
+
+    def __call__(self, positions, velocities, masses):
+
+        return -self.coefficient * velocities
+
+
+class Repulsion:
+    """
+    Soft-sphere repulsion of particles closer than radius, force is
+    stiffness * (radius - distance) along the line connecting them. Close pairs are found
+    with core.KDTree, so the cost is O(N log N).
+    """
+
+    def __init__(self, radius, stiffness):
+
+        self.radius = radius
+        self.stiffness = stiffness
+
+    def __call__(self, positions, velocities, masses):
+
+        forces = np.zeros_like(positions)
+        pairs = KDTree(positions).pairs(self.radius)
+        if not len(pairs):
+            return forces
+
+        first, second = pairs.T
+        difference = positions[first] - positions[second]
+        distance = np.linalg.norm(difference, axis=1)
+        distance[distance == 0] = np.finfo(float).tiny
+
+        magnitude = self.stiffness * (self.radius - distance) / distance
+        pair_forces = magnitude[:, np.newaxis] * difference
+        np.add.at(forces, first, pair_forces)
+        np.add.at(forces, second, -pair_forces)
+
+        return forces
+
+
+class Gravity:
+    """
+    Mutual gravitational attraction G * m1 * m2 / (r^2 + softening^2). With theta > 0 uses
+    the Barnes-Hut approximation, O(N log N), cells seen under ratio size / distance < theta
+    act as a single body in their center of mass. theta = 0 means exact direct summation, O(N^2).
+
+    Parameters
+    ----------
+    G : float
+    softening : float
+        Plummer softening length, avoids singular forces in close encounters.
+    theta : float
+        Opening angle of Barnes-Hut, usual values are 0.3 - 0.7.
+    leaf_size : int
+        Maximum number of particles in a leaf cell of the tree.
+    """
+
+    def __init__(self, G=1, softening=0, theta=0.5, leaf_size=32):
+
+        self.G = G
+        self.softening = softening
+        self.theta = theta
+        self.leaf_size = leaf_size
+
+    def __call__(self, positions, velocities, masses):
+
+        if self.theta > 0:
+            accelerations = self._barnes_hut(positions, masses)
+        else:
+            accelerations = self._direct(positions, masses, np.arange(len(positions)))
+
+        return self.G * masses[:, np.newaxis] * accelerations
+
+    def _pull(self, targets, sources, source_masses, exclude_self=None):
+        """ Accelerations (without G) of targets caused by point sources. """
+
+        difference = sources[np.newaxis] - targets[:, np.newaxis]
+        r2 = np.sum(difference**2, axis=2) + self.softening**2
+
+        with np.errstate(divide="ignore"):
+            weights = source_masses / r2**1.5
+        if exclude_self is not None:
+            weights[exclude_self] = 0
+
+        return np.einsum("ij,ijk->ik", weights, difference)
+
+    def _direct(self, positions, masses, indices, block_size=1024):
+
+        accelerations = np.empty((len(indices), positions.shape[1]))
+        for start in range(0, len(indices), block_size):
+            block = indices[start:start + block_size]
+            accelerations[start:start + block_size] = self._pull(
+                positions[block], positions, masses,
+                exclude_self=(np.arange(len(block)), block))
+
+        return accelerations
+
+    def _barnes_hut(self, positions, masses):
+
+        tree = _Tree(positions, masses, self.leaf_size)
+        accelerations = np.zeros_like(positions)
+
+        stack = [(0, np.arange(len(positions)))]
+        while stack:
+            node, active = stack.pop()
+            points = positions[active]
+
+            difference = tree.centers[node] - points
+            r2 = np.sum(difference**2, axis=1)
+            low, size = tree.lows[node], tree.sizes[node]
+            inside = np.all((points >= low) & (points <= low + size), axis=1)
+            accept = ~inside & (size**2 < self.theta**2 * r2)
+
+            if np.any(accept):
+                weight = tree.masses[node] / (r2[accept] + self.softening**2)**1.5
+                accelerations[active[accept]] += weight[:, np.newaxis] * difference[accept]
+
+            rest = active[~accept]
+            if not len(rest):
+                continue
+
+            members = tree.members[node]
+            if members is not None:
+                accelerations[rest] += self._pull(
+                    positions[rest], positions[members], masses[members],
+                    exclude_self=rest[:, np.newaxis] == members)
+            else:
+                stack.extend((child, rest) for child in tree.children[node])
+
+        return accelerations
+
+
+class _Tree:
+    """
+    Quadtree (2D) or octree (3D) for Barnes-Hut. Node data are in lists indexed by node id,
+    root is 0. Leaves have members (array of particle indices), inner nodes have children.
+    """
+
+    def __init__(self, positions, masses, leaf_size):
+
+        self.centers = []
+        self.masses = []
+        self.lows = []
+        self.sizes = []
+        self.members = []
+        self.children = []
+
+        low = positions.min(axis=0)
+        size = np.max(positions.max(axis=0) - low)
+
+        self._positions = positions
+        self._particle_masses = masses
+        self._leaf_size = leaf_size
+        self._dim_bits = 1 << np.arange(positions.shape[1])
+
+        self._build(np.arange(len(positions)), low, size)
+
+    def _build(self, indices, low, size):
+
+        node = len(self.centers)
+        node_masses = self._particle_masses[indices]
+        total_mass = node_masses.sum()
+
+        self.centers.append(node_masses @ self._positions[indices] / total_mass)
+        self.masses.append(total_mass)
+        self.lows.append(low)
+        self.sizes.append(size)
+        self.members.append(None)
+        self.children.append([])
+
+        # coincident particles can not be split, they stay in one leaf
+        if len(indices) <= self._leaf_size or size <= 1e-12 * (1 + np.abs(low).max()):
+            self.members[node] = indices
+            return node
+
+        half = size / 2
+        upper = self._positions[indices] >= low + half
+        codes = upper @ self._dim_bits
+
+        for code in np.unique(codes):
+            offset = (code & self._dim_bits) > 0
+            child = self._build(indices[codes == code], low + offset * half, half)
+            self.children[node].append(child)
+
+        return node
+
+
+def main():
+
+    from qt import Canvas, qt_app
+    from PyQt5.QtCore import QPointF
+
+    rng = np.random.default_rng(0)
+    system = ParticleSystem(
+        rng.normal(250, 60, (2000, 2)),
+        masses=rng.uniform(0.5, 1, 2000),
+        forces=[Gravity(G=50, softening=5)],
+    )
+
+    class App(Canvas):
+
+        def __init__(self):
+
+            super().__init__(anim_period=16)
+
+        def redraw(self):
+
+            system.step(0.05)
+            for x, y in system.positions:
+                self.p.drawPoint(QPointF(x, y))
+
+    qt_app(App())
+
+
+if __name__ == '__main__':
+    main()
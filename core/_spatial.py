@@ -0,0 +1,364 @@
+from itertools import product
+
+import numpy as np
+from scipy.spatial import cKDTree as _cKDTree
+
+from ._vector import _as_points
+
+
+class _PointIndex:
+    """
+    Storage shared by the spatial indices. Points get integer ids, which stay valid until
+    the point is removed or the index is rebuilt. Points can be scalar vectors, vector batches
+    or (N, dim) arrays, 2D or 3D. The dimension is taken from the first inserted points
+    unless dim is passed.
+    """
+
+    def __init__(self, points=None, dim=None):
+
+        self.dim = dim
+        self._coords = np.empty((0, dim or 0))
+        self._alive = np.empty(0, dtype=bool)
+
+        if points is not None:
+            self.rebuild(points)
+
+    def __len__(self):
+
+        return int(self._alive.sum())
+
+    @property
+    def ids(self):
+        """ Array of ids of all points in the index. """
+
+        return np.flatnonzero(self._alive)
+
+    def point(self, point_id):
+        """ Returns coordinates of the point with given id. """
+
+        self._check_id(point_id)
+        return self._coords[point_id].copy()
+
+    def rebuild(self, points):
+        """ Replaces content of the index by points, they get ids 0..N-1. Returns the ids. """
+
+        points = _as_points(points, self.dim)
+        if points.shape[1]:
+            self.dim = points.shape[1]
+        self._coords = points.copy()
+        self._alive = np.ones(len(points), dtype=bool)
+
+        self._build()
+        return np.arange(len(points))
+
+    def insert(self, point):
+        """ Inserts one point, returns its id. """
+
+        point = _as_points(point, self.dim)
+        if len(point) != 1:
+            raise ValueError("insert() takes a single point, use extend() for more.")
+
+        return self.extend(point)[0]
+
+    def extend(self, points):
+        """ Inserts more points, returns array of their ids. """
+
+        points = _as_points(points, self.dim)
+        if self.dim is None or not len(self._coords):
+            self.dim = points.shape[1]
+            self._coords = self._coords.reshape(0, self.dim)
+
+        first_id = len(self._coords)
+        self._coords = np.concatenate((self._coords, points))
+        self._alive = np.concatenate((self._alive, np.ones(len(points), dtype=bool)))
+
+        ids = np.arange(first_id, len(self._coords))
+        self._inserted(ids)
+        return ids
+
+    def remove(self, point_id):
+        """ Removes the point with given id. """
+
+        self._check_id(point_id)
+        self._alive[point_id] = False
+        self._removed(point_id)
+
+    def _check_id(self, point_id):
+
+        if not (0 <= point_id < len(self._alive) and self._alive[point_id]):
+            raise KeyError(f"No point with id {point_id} in the index.")
+
+    def _query_point(self, point):
+
+        return _as_points(point, self.dim)[0]
+
+    def _nearest_of(self, point, ids, k):
+        """ Picks k nearest points of candidate ids by brute force. """
+
+        if not len(ids):
+            return np.empty(0), ids
+
+        distances = np.linalg.norm(self._coords[ids] - point, axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        return distances[order], ids[order]
+
+    def _build(self):
+
+        raise NotImplementedError("This method is abstract, you need to implement it.")
+
+    def _inserted(self, ids):
+
+        raise NotImplementedError("This method is abstract, you need to implement it.")
+
+    def _removed(self, point_id):
+
+        raise NotImplementedError("This method is abstract, you need to implement it.")
+
+
+class UniformGrid(_PointIndex):
+    """
+    Spatial index dividing space into cubic cells of cell_size. Insertion and removal are O(1),
+    queries look only into the cells overlapping the query region. Works best when points
+    are spread evenly and queries have radius comparable to cell_size.
+
+    Parameters
+    ----------
+    cell_size : float
+        Edge length of a cell.
+    points : optional
+        Initial points, scalar vectors, vector batch or (N, dim) array-like.
+    dim : None, 2 or 3
+        Dimension of the points, taken from the first points if None.
+    """
+
+    def __init__(self, cell_size, points=None, dim=None):
+
+        if cell_size <= 0:
+            raise ValueError("Value of cell_size must be positive.")
+
+        self.cell_size = cell_size
+        self._cells = {}
+
+        super().__init__(points, dim)
+
+    def _cell_of(self, point):
+
+        return tuple(np.floor(point / self.cell_size).astype(int).tolist())
+
+    def _build(self):
+
+        self._cells = {}
+        self._inserted(self.ids)
+
+    def _inserted(self, ids):
+
+        cell_indices = np.floor(self._coords[ids] / self.cell_size).astype(int).tolist()
+        for point_id, cell in zip(ids.tolist(), cell_indices):
+            self._cells.setdefault(tuple(cell), set()).add(point_id)
+
+    def _removed(self, point_id):
+
+        cell = self._cell_of(self._coords[point_id])
+        self._cells[cell].discard(point_id)
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def _ids_in_cells(self, low, high):
+        """ Ids of points in cells with indices in [low, high] (inclusive, per axis). """
+
+        ids = []
+        n_cells = np.prod(np.asarray(high) - low + 1)
+
+        if n_cells > len(self._cells):
+            for cell, members in self._cells.items():
+                if all(l <= c <= h for c, l, h in zip(cell, low, high)):
+                    ids.extend(members)
+        else:
+            for cell in product(*(range(l, h + 1) for l, h in zip(low, high))):
+                ids.extend(self._cells.get(cell, ()))
+
+        return np.array(ids, dtype=int)
+
+    def within(self, point, radius):
+        """ Returns ids of points with distance <= radius from point, sorted by distance. """
+
+        point = self._query_point(point)
+        low = np.floor((point - radius) / self.cell_size).astype(int).tolist()
+        high = np.floor((point + radius) / self.cell_size).astype(int).tolist()
+
+        ids = self._ids_in_cells(low, high)
+        distances, ids = self._nearest_of(point, ids, len(ids))
+        return ids[distances <= radius]
+
+    def nearest(self, point, k=1):
+        """
+        Returns distances and ids of k points nearest to point, sorted by distance.
+        Fewer are returned if the index holds less than k points.
+        """
+
+        point = self._query_point(point)
+        k = min(k, len(self))
+        center = np.floor(point / self.cell_size).astype(int)
+
+        ring = 0
+        while True:
+            ids = self._ids_in_cells((center - ring).tolist(), (center + ring).tolist())
+            if len(ids) >= k:
+                distances, ids = self._nearest_of(point, ids, k)
+                # points outside of the searched cells are at least this far
+                searched = np.min(np.minimum(
+                    point - (center - ring) * self.cell_size,
+                    (center + ring + 1) * self.cell_size - point))
+
+                if not k or distances[-1] <= searched or len(ids) == len(self):
+                    break
+
+            ring += 1
+
+        # one more pass covering the whole ball of the kth distance
+        if k:
+            ids = self.within(point, distances[-1])
+            distances, ids = self._nearest_of(point, ids, k)
+
+        return distances, ids
+
+    def pairs(self, radius):
+        """ Returns (M, 2) array of ids of all point pairs closer than or equal to radius. """
+
+        if not self._cells:
+            return np.empty((0, 2), dtype=int)
+
+        reach = int(np.ceil(radius / self.cell_size))
+        # half of the neighbourhood, every pair of cells is visited once
+        offsets = [offset for offset in product(range(-reach, reach + 1), repeat=self.dim)
+                   if offset >= (0,) * self.dim]
+        found = []
+
+        for cell, members in self._cells.items():
+            members = np.fromiter(members, dtype=int, count=len(members))
+
+            for offset in offsets:
+                neighbour = tuple(c + o for c, o in zip(cell, offset))
+                if neighbour not in self._cells:
+                    continue
+
+                others = np.fromiter(self._cells[neighbour], dtype=int)
+                distances = np.linalg.norm(
+                    self._coords[members, np.newaxis] - self._coords[others], axis=2)
+                i, j = np.nonzero(distances <= radius)
+                first, second = members[i], others[j]
+
+                if not any(offset):
+                    keep = first < second
+                    first, second = first[keep], second[keep]
+                found.append(np.column_stack((first, second)))
+
+        if not found:
+            return np.empty((0, 2), dtype=int)
+
+        found = np.concatenate(found)
+        return np.sort(found, axis=1)
+
+
+class KDTree(_PointIndex):
+    """
+    k-d tree spatial index built on scipy.spatial.cKDTree. The tree itself is static, inserted
+    points are kept in a side buffer and removed ones are masked, queries merge both. The tree
+    is rebuilt automatically once the buffer or the masked points exceed rebuild_fraction of
+    the tree size, rebuild() replaces all points at once.
+
+    Parameters
+    ----------
+    points : optional
+        Initial points, scalar vectors, vector batch or (N, dim) array-like.
+    dim : None, 2 or 3
+        Dimension of the points, taken from the first points if None.
+    leafsize : int
+        Passed to cKDTree.
+    rebuild_fraction : float
+        Fraction of changed points that triggers the automatic rebuild.
+    """
+
+    def __init__(self, points=None, dim=None, leafsize=16, rebuild_fraction=0.25):
+
+        self.leafsize = leafsize
+        self.rebuild_fraction = rebuild_fraction
+
+        self._tree = None
+        self._tree_ids = np.empty(0, dtype=int)
+        self._pending = []
+        self._n_removed_in_tree = 0
+
+        super().__init__(points, dim)
+
+    def _build(self):
+
+        self._tree_ids = self.ids
+        self._tree = _cKDTree(self._coords[self._tree_ids], leafsize=self.leafsize) \
+            if len(self._tree_ids) else None
+        self._pending = []
+        self._n_removed_in_tree = 0
+
+    def _changed(self):
+
+        n_changed = len(self._pending) + self._n_removed_in_tree
+        if n_changed > self.rebuild_fraction * max(len(self._tree_ids), 1):
+            self._build()
+
+    def _inserted(self, ids):
+
+        self._pending.extend(ids.tolist())
+        self._changed()
+
+    def _removed(self, point_id):
+
+        if point_id in self._pending:
+            self._pending.remove(point_id)
+        else:
+            self._n_removed_in_tree += 1
+        self._changed()
+
+    def _pending_ids(self):
+
+        return np.array(self._pending, dtype=int)
+
+    def within(self, point, radius):
+        """ Returns ids of points with distance <= radius from point, sorted by distance. """
+
+        point = self._query_point(point)
+        ids = [self._pending_ids()]
+
+        if self._tree is not None:
+            tree_ids = self._tree_ids[self._tree.query_ball_point(point, radius)]
+            ids.append(tree_ids[self._alive[tree_ids]])
+
+        distances, ids = self._nearest_of(point, np.concatenate(ids), None)
+        return ids[distances <= radius]
+
+    def nearest(self, point, k=1):
+        """
+        Returns distances and ids of k points nearest to point, sorted by distance.
+        Fewer are returned if the index holds less than k points.
+        """
+
+        point = self._query_point(point)
+        ids = [self._pending_ids()]
+
+        if self._tree is not None:
+            n_query = min(k + self._n_removed_in_tree, len(self._tree_ids))
+            _, found = self._tree.query(point, k=n_query)
+            tree_ids = self._tree_ids[np.atleast_1d(found)]
+            ids.append(tree_ids[self._alive[tree_ids]])
+
+        return self._nearest_of(point, np.concatenate(ids), k)
+
+    def pairs(self, radius):
+        """ Returns (M, 2) array of ids of all point pairs closer than or equal to radius. """
+
+        if self._pending or self._n_removed_in_tree:
+            self._build()
+        if self._tree is None:
+            return np.empty((0, 2), dtype=int)
+
+        found = self._tree.query_pairs(radius, output_type="ndarray")
+        return np.sort(self._tree_ids[found], axis=1)
@@ -0,0 +1,152 @@
+import numpy as np
+
+from ._vector import Vector3D, Vector3DArray
+
+
+class Transform:
+    """
+    Affine (or projective) transform of 3D points, stored as a 4x4 homogeneous matrix.
+    Transforms are composed with @, (a @ b) applies b first and a second. Calling the transform
+    is the same as calling apply().
+
+    Parameters
+    ----------
+    matrix : 3x3 or 4x4 array-like
+        3x3 matrix is a linear map (rotation, scaling...), 4x4 is a homogeneous matrix.
+    """
+
+    def __init__(self, matrix):
+
+        matrix = np.array(matrix, dtype=float)
+
+        if matrix.shape == (3, 3):
+            homogeneous = np.identity(4)
+            homogeneous[:3, :3] = matrix
+            matrix = homogeneous
+        elif matrix.shape != (4, 4):
+            raise ValueError("Matrix has wrong shape, it is supposed to be 3x3 or 4x4.")
+
+        self._matrix = matrix
+        self._linear = np.ascontiguousarray(matrix[:3, :3].T)
+        self._offset = matrix[:3, 3].copy()
+        self._projective = not np.array_equal(matrix[3], (0, 0, 0, 1))
+
+    @classmethod
+    def identity(cls):
+
+        return cls(np.identity(4))
+
+    @classmethod
+    def translation(cls, offset):
+
+        matrix = np.identity(4)
+        matrix[:3, 3] = offset
+        return cls(matrix)
+
+    @classmethod
+    def scaling(cls, factors):
+        """ Factors is a scalar or a 3-sequence of per-axis factors. """
+
+        return cls(np.diag(np.broadcast_to(np.asarray(factors, dtype=float), 3)))
+
+    @classmethod
+    def from_quaternion(cls, q):
+        """
+        Rotation given by quaternion q = (w, x, y, z). The quaternion is normalized first.
+        """
+
+        w, x, y, z = np.asarray(q, dtype=float) / np.linalg.norm(q)
+
+        return cls([
+            [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+            [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+            [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+        ])
+
+    @classmethod
+    def rotation(cls, axis, angle, deg=False):
+        """ Rotation around axis (3-sequence or Vector3D) by angle, radians by default. """
+
+        if isinstance(axis, Vector3D):
+            axis = axis.get()
+        if deg:
+            angle = np.radians(angle)
+
+        axis = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+        return cls.from_quaternion((np.cos(angle / 2), *(np.sin(angle / 2) * axis)))
+
+    @classmethod
+    def chain(cls, *transforms):
+        """ Composes the transforms so that they are applied in the order they were passed. """
+
+        matrix = np.identity(4)
+        for transform in transforms:
+            matrix = transform._matrix @ matrix
+
+        return cls(matrix)
+
+    @property
+    def matrix(self):
+        """ Copy of the 4x4 homogeneous matrix. """
+
+        return self._matrix.copy()
+
+    def inverse(self):
+
+        return Transform(np.linalg.inv(self._matrix))
+
+    def apply(self, points, out=None):
+        """
+        Applies the transform to points in one vectorized call.
+
+        Parameters
+        ----------
+        points : Vector3D, Vector3DArray or (N, 3) array-like
+        out : None, Vector3DArray or (N, 3) ndarray
+            Preallocated buffer for the result, matching the type of points. May be the same
+            object as points to transform in place. Not used for Vector3D.
+
+        Returns
+        -------
+        transformed points of the same type as points (out, if it was passed)
+        """
+
+        if isinstance(points, Vector3D):
+            return Vector3D(*self._apply(np.array([points.get()], dtype=float))[0].tolist())
+
+        if isinstance(points, Vector3DArray):
+            out_array = out.points if out is not None else None
+            result = self._apply(points.points, out_array)
+            return out if out is not None else Vector3DArray.from_points(result)
+
+        points = np.asarray(points, dtype=float)
+        if points.ndim != 2 or points.shape[1] != 3:
+            raise ValueError("Points have to have shape (N, 3).")
+
+        return self._apply(points, out)
+
+    def _apply(self, points, out=None):
+        """ Transforms (N, 3) array of points, writing into out if it is not None. """
+
+        if self._projective:
+            w = points @ self._matrix[3, :3] + self._matrix[3, 3]
+
+        out = np.matmul(points, self._linear, out=out)
+        out += self._offset
+
+        if self._projective:
+            out /= w[:, np.newaxis]
+
+        return out
+
+    def __call__(self, points, out=None):
+
+        return self.apply(points, out=out)
+
+    def __matmul__(self, second):
+
+        return Transform(self._matrix @ second._matrix)
+
+    def __repr__(self):
+
+        return f"Transform({self._matrix.tolist()})"
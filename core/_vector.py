@@ -1,7 +1,18 @@
-from math import acos, degrees, sin, cos, radians
+from math import atan2, degrees, sin, cos, radians
+
+import numpy as np
 
 
 class Vector2D:
+    """
+    Immutable 2D vector. Components are read-only properties and instances are slotted
+    (no per-instance __dict__), hashable and usable as dict keys and set members.
+    Often reused values can be shared through Vector2D.interned(x, y).
+    """
+
+    __slots__ = ("_x", "_y", "_abs")
+
+    _interned = {}
 
     def __init__(self, x, y):
 
@@ -20,18 +31,32 @@ class Vector2D:
 
         return self._y
 
+    @classmethod
+    def interned(cls, x, y):
+        """
+        Returns a shared instance with the given components, creating it on first use.
+        Intended for constants, the cache is never emptied.
+        """
+
+        key = (x, y)
+        try:
+            return cls._interned[key]
+        except KeyError:
+            vector = cls._interned[key] = cls(x, y)
+            return vector
+
     def normalized(self):
 
         norm = abs(self)
-        return Vector2D(self.x / norm, self.y / norm)
+        return Vector2D(self._x / norm, self._y / norm)
 
     def norm(self, p=2):
 
-        return (self.x**p + self.y**p)**(1 / p)
+        return (self._x**p + self._y**p)**(1 / p)
 
     def normal(self):
 
-        return Vector2D(self.y, -self.x)
+        return Vector2D(self._y, -self._x)
 
     def angle(self, second=None, deg=False):
         """
@@ -39,10 +64,12 @@ class Vector2D:
         returns its angle from horizontal. If deg is True, retruns degrees, default is radians
         """
 
-        if not second:
-            second = Vector2D(1, 0)
+        if second is None:
+            second = Vector2D.interned(1, 0)
 
-        angle_radians = acos(self @ second / (abs(self) * abs(second)))
+        # atan2 of cross and dot product is accurate also for (anti)parallel vectors
+        cross = self._x * second.y - self._y * second.x
+        angle_radians = atan2(abs(cross), self @ second)
 
         if deg:
             return degrees(angle_radians)
@@ -51,50 +78,83 @@ class Vector2D:
 
     def get(self):
 
-        return self.x, self.y
+        return self._x, self._y
 
     def __add__(self, second):
 
-        return Vector2D(self.x + second.x, self.y + second.y)
+        if not isinstance(second, Vector2D):
+            return NotImplemented
+
+        return Vector2D(self._x + second.x, self._y + second.y)
 
     def __sub__(self, second):
 
-        return Vector2D(self.x - second.x, self.y - second.y)
+        if not isinstance(second, Vector2D):
+            return NotImplemented
+
+        return Vector2D(self._x - second.x, self._y - second.y)
 
     def __mul__(self, scalar):
 
-        return Vector2D(self.x * scalar, self.y * scalar)
+        return Vector2D(self._x * scalar, self._y * scalar)
 
-    def __div__(self, scalar):
+    def __truediv__(self, scalar):
 
-        return Vector2D(self.x / scalar, self.y / scalar)
+        return Vector2D(self._x / scalar, self._y / scalar)
 
     def __matmul__(self, second):
 
-        return self.x * second.x + self.y * second.y
+        if not isinstance(second, Vector2D):
+            return NotImplemented
+
+        return self._x * second.x + self._y * second.y
 
     def __neg__(self):
 
-        return Vector2D(-self.x, -self.y)
+        return Vector2D(-self._x, -self._y)
 
     def __abs__(self):
         """ Returns the absolute value of the vector, meaning euclidean norm. Is lazy. """
 
         if self._abs is None:
-            self._abs = (self.x**2 + self.y**2)**0.5
+            self._abs = (self._x**2 + self._y**2)**0.5
 
         return self._abs
 
     def __eq__(self, second):
 
-        return self.x == second.x and self.y == second.y
+        if not isinstance(second, Vector2D):
+            return NotImplemented
+
+        return self._x == second.x and self._y == second.y
+
+    def __hash__(self):
+
+        return hash((self._x, self._y))
+
+    def __reduce__(self):
+
+        return Vector2D, (self._x, self._y)
+
+    def __array__(self, dtype=None, copy=None):
+
+        return np.array((self._x, self._y), dtype=dtype)
 
     def __repr__(self):
 
-        return f"Vector2D(x={self.x}, y={self.y})"
+        return f"Vector2D(x={self._x}, y={self._y})"
 
 
 class Vector3D:
+    """
+    Immutable 3D vector. Components are read-only properties and instances are slotted
+    (no per-instance __dict__), hashable and usable as dict keys and set members.
+    Often reused values can be shared through Vector3D.interned(x, y, z).
+    """
+
+    __slots__ = ("_x", "_y", "_z", "_abs")
+
+    _interned = {}
 
     def __init__(self, x, y, z):
 
@@ -119,69 +179,96 @@ class Vector3D:
 
         return self._z
 
+    @classmethod
+    def interned(cls, x, y, z):
+        """
+        Returns a shared instance with the given components, creating it on first use.
+        Intended for constants, the cache is never emptied.
+        """
+
+        key = (x, y, z)
+        try:
+            return cls._interned[key]
+        except KeyError:
+            vector = cls._interned[key] = cls(x, y, z)
+            return vector
+
     def normalized(self):
 
         norm = abs(self)
-        return Vector3D(self.x / norm, self.y / norm, self.z / norm)
+        return Vector3D(self._x / norm, self._y / norm, self._z / norm)
 
     def norm(self, p=2):
 
-        return (self.x**p + self.y**p + self.z**p)**(1 / p)
+        return (self._x**p + self._y**p + self._z**p)**(1 / p)
 
     def angle(self, second=None, deg=False):
         """
         Returns the angle between self and second vector. If no second vector is passed,
-        returns its angle from horizontal. If deg is True, retruns degrees, default is radians
+        returns its angle from the x axis. If deg is True, retruns degrees, default is radians
         """
-        raise NotImplementedError()
-        # if not second:
-        #     second = Vector2D(1, 0)
-        #
-        # angle_radians = acos(self @ second / (abs(self) * abs(second)))
-        #
-        # if deg:
-        #     return degrees(angle_radians)
-        # else:
-        #     return angle_radians
+
+        if second is None:
+            second = Vector3D.interned(1, 0, 0)
+
+        cross = Vector3D(self._y * second.z - self._z * second.y,
+                         self._z * second.x - self._x * second.z,
+                         self._x * second.y - self._y * second.x)
+        angle_radians = atan2(abs(cross), self @ second)
+
+        if deg:
+            return degrees(angle_radians)
+        else:
+            return angle_radians
 
     def get(self):
 
-        return self.x, self.y, self.z
+        return self._x, self._y, self._z
 
     def multiply_numpy(self, array):
+        """
+        Returns array @ self for a 3x3 array. To transform many points at once,
+        use core.Transform.
+        """
 
+        array = np.asarray(array)
         if array.shape != (3,3):
             raise ValueError("Array has wrong shape, it is supposed to be 3x3.")
 
-        x = Vector3D(*array[0]) @ self
-        y = Vector3D(*array[1]) @ self
-        z = Vector3D(*array[2]) @ self
-
-        return Vector3D(x, y, z)
+        return Vector3D(*(array @ (self._x, self._y, self._z)).tolist())
 
     def __add__(self, second):
 
-        return Vector3D(self.x + second.x, self.y + second.y, self.z + second.z)
+        if not isinstance(second, Vector3D):
+            return NotImplemented
+
+        return Vector3D(self._x + second.x, self._y + second.y, self._z + second.z)
 
     def __sub__(self, second):
 
-        return Vector3D(self.x - second.x, self.y - second.y, self.z - second.z)
+        if not isinstance(second, Vector3D):
+            return NotImplemented
+
+        return Vector3D(self._x - second.x, self._y - second.y, self._z - second.z)
 
     def __mul__(self, scalar):
 
-        return Vector3D(self.x * scalar, self.y * scalar, self.z * scalar)
+        return Vector3D(self._x * scalar, self._y * scalar, self._z * scalar)
 
-    def __div__(self, scalar):
+    def __truediv__(self, scalar):
 
-        return Vector3D(self.x / scalar, self.y / scalar, self.z / scalar)
+        return Vector3D(self._x / scalar, self._y / scalar, self._z / scalar)
 
     def __matmul__(self, second):
 
-        return self.x * second.x + self.y * second.y + self.z * second.z
+        if not isinstance(second, Vector3D):
+            return NotImplemented
+
+        return self._x * second.x + self._y * second.y + self._z * second.z
 
     def __neg__(self):
 
-        return Vector3D(-self.x, -self.y, -self.z)
+        return Vector3D(-self._x, -self._y, -self._z)
 
     def __abs__(self):
         """ Returns the absolute value of the vector, meaning euclidean norm. Is lazy. """
@@ -193,11 +280,353 @@ class Vector3D:
 
     def __eq__(self, second):
 
-        return self.x == second.x and self.y == second.y and self.z == second.z
+        if not isinstance(second, Vector3D):
+            return NotImplemented
+
+        return self._x == second.x and self._y == second.y and self._z == second.z
+
+    def __hash__(self):
+
+        return hash((self._x, self._y, self._z))
+
+    def __reduce__(self):
+
+        return Vector3D, (self._x, self._y, self._z)
+
+    def __array__(self, dtype=None, copy=None):
+
+        return np.array((self._x, self._y, self._z), dtype=dtype)
+
+    def __repr__(self):
+
+        return f"Vector3D(x={self._x}, y={self._y}, z={self._z})"
+
+
+class _VectorArray:
+    """
+    Base of the array-backed vector batches. Components are stored as a structure of arrays,
+    self._data has shape (dim, N) and self._data[i] holds the i-th component of all vectors.
+    Subclasses set _dim and _scalar (the corresponding single-value class).
+    """
+
+    _dim = None
+    _scalar = None
+
+    # ndarray operands defer to the reflected operators instead of converting the batch
+    __array_ufunc__ = None
+
+    def __init__(self, *components):
+
+        data = np.array(components, dtype=float)
+
+        if data.ndim != 2 or data.shape[0] != self._dim:
+            raise ValueError(
+                f"{type(self).__name__} needs {self._dim} one-dimensional component sequences "
+                "of equal length.")
+
+        self._data = data
+
+    @classmethod
+    def _from_data(cls, data):
+        """ Wraps (dim, N) array without copying it. """
+
+        obj = cls.__new__(cls)
+        obj._data = data
+        return obj
+
+    @classmethod
+    def from_points(cls, points):
+        """
+        Creates the batch from an (N, dim) array-like of points. The data is copied.
+
+        Parameters
+        ----------
+        points : (N, dim) array-like
+        """
+
+        points = np.array(points, dtype=float, ndmin=2)
+
+        if points.ndim != 2 or points.shape[1] != cls._dim:
+            raise ValueError(f"Points have to have shape (N, {cls._dim}).")
+
+        return cls._from_data(np.ascontiguousarray(points.T))
+
+    @classmethod
+    def from_buffer(cls, buffer, layout="points"):
+        """
+        Creates the batch as a view of buffer, without copying. Changes of the batch made in place
+        (+=, -=, *=, /=) are visible in the buffer and vice versa, so one buffer can be shared
+        by simulation, Qt drawing and Matplotlib.
+
+        Parameters
+        ----------
+        buffer : numpy.ndarray, memoryview, array.array or other object with buffer protocol
+            Float data, flat or already shaped.
+        layout : "points" or "components"
+            "points" means interleaved (x0, y0, x1, y1, ...) data, i.e. shape (N, dim),
+            "components" means (x0, x1, ..., y0, y1, ...), i.e. shape (dim, N).
+        """
+
+        array = np.asarray(buffer)
+
+        if layout == "points":
+            data = array.reshape(-1, cls._dim).T
+        elif layout == "components":
+            data = array.reshape(cls._dim, -1)
+        else:
+            raise ValueError('Value of layout must be "points" or "components".')
+
+        if not np.may_share_memory(data, array):
+            raise ValueError("Buffer can not be viewed without copying.")
+
+        return cls._from_data(data)
+
+    @classmethod
+    def from_list(cls, vectors):
+        """
+        Creates the batch from a sequence of scalar vectors (or anything with get() method).
+        """
+
+        return cls.from_points([v.get() for v in vectors] or np.empty((0, cls._dim)))
+
+    def to_list(self):
+        """ Returns list of scalar vectors with the same values. """
+
+        return [self._scalar(*p) for p in self.points.tolist()]
+
+    @property
+    def points(self):
+        """ (N, dim) view of the data. """
+
+        return self._data.T
+
+    def get(self):
+        """ Returns tuple of component arrays, analogous to the scalar get(). """
+
+        return tuple(self._data)
+
+    def normalized(self):
+
+        return self._from_data(self._data / abs(self))
+
+    def norm(self, p=2):
+
+        return ((self._data**p).sum(axis=0))**(1 / p)
+
+    def angle(self, second=None, deg=False):
+        """
+        Returns the angles between vectors in self and second. Second can be a scalar vector or
+        a batch of the same length. If no second vector is passed, returns the angles from
+        the horizontal (x) axis. If deg is True, returns degrees, default is radians.
+        """
+
+        if second is None:
+            second = self._scalar.interned(1, *[0] * (self._dim - 1))
+
+        # atan2 of cross and dot product, like the scalar vectors and pairwise_angles
+        other = self._operand(second)
+        if self._dim == 2:
+            cross_norm = np.abs(self._data[0] * other[1] - self._data[1] * other[0])
+        else:
+            cross_norm = np.linalg.norm(np.cross(self._data, other, axis=0), axis=0)
+        angle_radians = np.arctan2(cross_norm, self @ second)
+
+        if deg:
+            return np.degrees(angle_radians)
+        else:
+            return angle_radians
+
+    def _operand(self, second):
+        """ Returns data of second vector(s) in a shape broadcastable against self._data. """
+
+        if isinstance(second, _VectorArray):
+            return second._data
+        return np.array(second.get(), dtype=float)[:, np.newaxis]
+
+    def __len__(self):
+
+        return self._data.shape[1]
+
+    def __getitem__(self, index):
+
+        if isinstance(index, (int, np.integer)):
+            return self._scalar(*self._data[:, index].tolist())
+
+        return self._from_data(self._data[:, index])
+
+    def __iter__(self):
+
+        return iter(self.to_list())
+
+    def __add__(self, second):
+
+        return self._from_data(self._data + self._operand(second))
+
+    __radd__ = __add__
+
+    def __sub__(self, second):
+
+        return self._from_data(self._data - self._operand(second))
+
+    def __rsub__(self, second):
+
+        return self._from_data(self._operand(second) - self._data)
+
+    def __mul__(self, scalar):
+
+        return self._from_data(self._data * scalar)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, scalar):
+
+        return self._from_data(self._data / scalar)
+
+    def __matmul__(self, second):
+
+        return (self._data * self._operand(second)).sum(axis=0)
+
+    __rmatmul__ = __matmul__
+
+    def __iadd__(self, second):
+
+        self._data += self._operand(second)
+        return self
+
+    def __isub__(self, second):
+
+        self._data -= self._operand(second)
+        return self
+
+    def __imul__(self, scalar):
+
+        self._data *= scalar
+        return self
+
+    def __itruediv__(self, scalar):
+
+        self._data /= scalar
+        return self
+
+    def __neg__(self):
+
+        return self._from_data(-self._data)
+
+    def __abs__(self):
+        """ Returns the euclidean norms of all vectors as an array. """
+
+        return np.sqrt((self._data**2).sum(axis=0))
+
+    def __array__(self, dtype=None, copy=None):
+        """ (N, dim) view of the data, np.asarray(batch) does not copy. """
+
+        if copy:
+            return np.array(self.points, dtype=dtype)
+        return np.asarray(self.points, dtype=dtype)
+
+    def __buffer__(self, flags):
+        """ Buffer protocol (Python 3.12+), exports the (N, dim) view of the data. """
+
+        return memoryview(self.points)
 
     def __repr__(self):
 
-        return f"Vector3D(x={self.x}, y={self.y}, z={self.z})"
+        return f"{type(self).__name__}(n={len(self)})"
+
+
+class Vector2DArray(_VectorArray):
+    """
+    Batch of N 2D vectors backed by NumPy arrays. Supports the same operations as Vector2D,
+    vectorized over the whole batch. The other operand can be a Vector2D (broadcast) or
+    Vector2DArray of the same length. Scalars for * and / can be numbers or arrays of length N.
+
+    Parameters
+    ----------
+    x : N-length sequence
+    y : N-length sequence
+    """
+
+    _dim = 2
+
+    def __init__(self, x, y):
+
+        super().__init__(x, y)
+
+    @property
+    def x(self):
+
+        return self._data[0]
+
+    @property
+    def y(self):
+
+        return self._data[1]
+
+    def normal(self):
+
+        return self._from_data(np.stack((self._data[1], -self._data[0])))
+
+
+class Vector3DArray(_VectorArray):
+    """
+    Batch of N 3D vectors backed by NumPy arrays. Supports the same operations as Vector3D,
+    vectorized over the whole batch. The other operand can be a Vector3D (broadcast) or
+    Vector3DArray of the same length. Scalars for * and / can be numbers or arrays of length N.
+
+    Parameters
+    ----------
+    x : N-length sequence
+    y : N-length sequence
+    z : N-length sequence
+    """
+
+    _dim = 3
+
+    def __init__(self, x, y, z):
+
+        super().__init__(x, y, z)
+
+    @property
+    def x(self):
+
+        return self._data[0]
+
+    @property
+    def y(self):
+
+        return self._data[1]
+
+    @property
+    def z(self):
+
+        return self._data[2]
+
+
+Vector2DArray._scalar = Vector2D
+Vector3DArray._scalar = Vector3D
+
+
+def _as_points(points, dim=None):
+    """
+    Converts scalar vector, sequence of scalar vectors, vector batch or (N, dim) array-like
+    to (N, dim) float ndarray. Single vector gives shape (1, dim), empty sequence (0, dim).
+    """
+
+    if isinstance(points, _VectorArray):
+        points = points.points
+    elif isinstance(points, (Vector2D, Vector3D)):
+        points = [points.get()]
+    elif len(points) and isinstance(points[0], (Vector2D, Vector3D)):
+        points = [p.get() for p in points]
+
+    points = np.asarray(points, dtype=float)
+    if points.ndim == 1:
+        points = points[np.newaxis] if len(points) else points.reshape(0, dim or 0)
+
+    if points.ndim != 2 or (dim is not None and points.shape[1] != dim):
+        raise ValueError(f"Points have to have shape (N, {dim or 'dim'}).")
+
+    return points
 
 
 def main():
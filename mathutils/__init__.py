@@ -1,7 +1,13 @@
-from scipy.misc import derivative as _derivative
+import numpy as np
 
+from ._finite_differences import central_difference_weights, jacobian, gradient
+from ._finite_differences import derivative_adaptive, partial_derivative_adaptive, gradient_adaptive
+from ._dual import Dual, derivatives
+from ._streaming import RunningMoments, QuantileSketch
+from ._cache import EvaluationCache
 
-def partial_derivative(f, with_respect_to, arguments, n=1, dx=1e-6):
+
+def partial_derivative(f, with_respect_to, arguments, n=1, dx=1e-6, order=2, cache=None):
     """
     Calculates partial derivative of function f(a1, a2, a3,...) with respect to 
     argument in position given by with_respect_to.
@@ -16,6 +22,10 @@ def partial_derivative(f, with_respect_to, arguments, n=1, dx=1e-6):
         arguments to f
     n : int
     dx : float
+    order : even int
+        order of accuracy of the central difference
+    cache : EvaluationCache, optional
+        memoizes the evaluations of f
     """
 
     arguments_list = list(arguments)
@@ -26,9 +36,14 @@ def partial_derivative(f, with_respect_to, arguments, n=1, dx=1e-6):
         arguments_with_val = arguments_list[:with_respect_to] \
             + [arg] \
             + arguments_list[with_respect_to + 1:]
+        if cache is not None:
+            return cache.evaluate(f, arguments_with_val)
         return f(*arguments_with_val)
 
     if helper(arguments[with_respect_to]) is None:
         raise Exception("f doesn't have a return value")
 
-    return _derivative(helper, arguments[with_respect_to], n=n, dx=dx)
+    offsets, weights = central_difference_weights(n, order)
+    values = [helper(arguments[with_respect_to] + offset * dx) for offset in offsets]
+
+    return np.dot(weights, values) / dx**n
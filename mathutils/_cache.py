@@ -0,0 +1,244 @@
+import hashlib
+import shelve
+import types
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+class _Unstable(Exception):
+    """ Raised by _fingerprint for values without a stable fingerprint. """
+
+
+def _fingerprint(value, active=frozenset()):
+    """
+    Returns string identifying value by content, stable between processes and sessions.
+    Raises _Unstable for values that can't be fingerprinted. active are the functions whose
+    fingerprint is being calculated, see _function_fingerprint.
+    """
+
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return repr(value)
+    if isinstance(value, np.generic):
+        return repr(value.item())
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha1(np.ascontiguousarray(value).view(np.uint8)).hexdigest()
+        return f"array({value.dtype},{value.shape},{digest})"
+    if isinstance(value, (tuple, list)):
+        return f"{type(value).__name__}({','.join(_fingerprint(v, active) for v in value)})"
+    if isinstance(value, frozenset):
+        return f"frozenset({','.join(sorted(_fingerprint(v, active) for v in value))})"
+    if isinstance(value, types.CodeType):
+        return (f"code({value.co_code.hex()},{_fingerprint(value.co_consts, active)},"
+                f"{_fingerprint(value.co_names)})")
+    if isinstance(value, types.ModuleType):
+        return f"module({value.__name__},{getattr(value, '__version__', '')})"
+    if callable(value):
+        return _function_fingerprint(value, active)
+
+    raise _Unstable(type(value))
+
+
+def _global_names(code):
+    """ Names of globals (and attributes) used by code, including nested functions. """
+
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+
+    return names
+
+
+# fingerprints of functions by the function object, None for unstable ones
+_FINGERPRINTS = weakref.WeakKeyDictionary()
+
+
+def _function_fingerprint(f, active=frozenset()):
+    """
+    Identifies function by its module, name, code, values captured in its closure, default
+    arguments and values of the global variables it uses, helper functions recursively,
+    so that e.g. two lambdas with different captured data differ and a changed helper
+    invalidates the persistent cache. Modules are identified by name and version, builtin
+    functions and ufuncs by name.
+    The fingerprint of a function is calculated once and remembered while the function
+    exists, values it captures or reads from globals must not change in the meantime.
+    """
+
+    func = getattr(f, "__func__", None)
+    if func is not None:
+        # bound method, self has to be identified too
+        return (f"method({_function_fingerprint(func, active)},"
+                f"{_fingerprint(f.__self__, active)})")
+
+    if isinstance(f, np.ufunc):
+        return f"ufunc({f.__name__})"
+    if isinstance(f, types.BuiltinFunctionType) \
+            and (f.__self__ is None or isinstance(f.__self__, types.ModuleType)):
+        return f"builtin({f.__module__}.{f.__qualname__})"
+
+    code = getattr(f, "__code__", None)
+    if code is None:
+        raise _Unstable(type(f))
+
+    if f in active:
+        # recursion, the code is already a part of the fingerprint
+        return f"recursive({f.__module__}.{f.__qualname__})"
+
+    # only complete fingerprints are remembered, not those cut by recursion
+    if not active and f in _FINGERPRINTS:
+        if _FINGERPRINTS[f] is None:
+            raise _Unstable(type(f))
+        return _FINGERPRINTS[f]
+
+    inner = active | {f}
+    try:
+        parts = [f.__module__, f.__qualname__, _fingerprint(code, inner)]
+        parts += [_fingerprint(cell.cell_contents, inner) for cell in (f.__closure__ or ())]
+        parts.append(_fingerprint(f.__defaults__, inner))
+        parts += [f"{name}={_fingerprint(f.__globals__[name], inner)}"
+                  for name in sorted(_global_names(code)) if name in f.__globals__]
+        fingerprint = hashlib.sha1("|".join(parts).encode()).hexdigest()
+    except _Unstable:
+        if not active:
+            _FINGERPRINTS[f] = None
+        raise
+
+    if not active:
+        _FINGERPRINTS[f] = fingerprint
+    return fingerprint
+
+
+class EvaluationCache:
+    """
+    Memoizes evaluations of (expensive) functions, keyed by the function identity and
+    the arguments. Keeps at most maxsize results in memory, least recently used ones are
+    dropped. With path, results are also stored in a shelve database and survive between
+    sessions, only for functions and arguments with stable fingerprints (numbers, strings,
+    arrays, tuples, plain functions capturing those or reading them from globals), others
+    are cached in memory only.
+    Counts hits and misses.
+
+    Pass it as cache to mathutils.gradient, jacobian, partial_derivative,
+    the *_adaptive derivatives and uncertainty.up_function, or wrap a function with wrap().
+    Arguments are keyed by value, pass floats (not ints) to share entries between routines.
+
+    Parameters
+    ----------
+    maxsize : int or None
+        maximum number of results in memory, None is unbounded
+    path : str, optional
+        file name of the on-disk database
+    """
+
+    def __init__(self, maxsize=10000, path=None):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._disk = shelve.open(path) if path is not None else None
+
+    def key(self, f, args):
+        """ Returns (key, persistent), persistent is False if key is valid only in this process. """
+
+        try:
+            return hashlib.sha1(f"{_function_fingerprint(f)}|{_fingerprint(tuple(args))}"
+                                .encode()).hexdigest(), True
+        except _Unstable:
+            # f itself is part of the key, the reference keeps it alive, so its id can't be
+            # reused by another function
+            return (f, tuple(args)), False
+
+    def contains(self, f, args):
+        """ Returns whether f(*args) is cached, without counting it as hit or miss. """
+
+        key, persistent = self.key(f, args)
+        return key in self._memory or (persistent and self._disk is not None and key in self._disk)
+
+    def lookup(self, f, args):
+        """ Returns (found, value). Does not evaluate f, counts hits and misses. """
+
+        key, persistent = self.key(f, args)
+
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return True, self._memory[key]
+
+        if persistent and self._disk is not None and key in self._disk:
+            value = self._disk[key]
+            self._remember(key, value)
+            self.hits += 1
+            return True, value
+
+        self.misses += 1
+        return False, None
+
+    def store(self, f, args, value):
+
+        key, persistent = self.key(f, args)
+        self._remember(key, value)
+
+        if persistent and self._disk is not None:
+            self._disk[key] = value
+
+    def _remember(self, key, value):
+
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+
+        if self.maxsize is not None:
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def evaluate(self, f, args):
+        """ Returns f(*args), from the cache if possible. """
+
+        found, value = self.lookup(f, args)
+        if not found:
+            value = f(*args)
+            self.store(f, args, value)
+
+        return value
+
+    def wrap(self, f):
+        """ Returns memoized version of f. """
+
+        def wrapped(*args):
+
+            return self.evaluate(f, args)
+
+        wrapped.__wrapped__ = f
+        return wrapped
+
+    def clear(self):
+        """ Empties the memory part of the cache and resets the counters. """
+
+        self._memory.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def __len__(self):
+
+        return len(self._memory)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        self.close()
+
+    def __repr__(self):
+
+        return f"EvaluationCache(hits={self.hits}, misses={self.misses}, size={len(self)})"
@@ -0,0 +1,293 @@
+import numpy as np
+
+
+class Dual:
+    """
+    Dual number for forward-mode automatic differentiation, value + sum(derivatives[i] * e_i),
+    where e_i are independent infinitesimal seed directions. Supports arithmetic and numpy
+    ufuncs (np.sin(d), np.exp(d), ...), so numpy-written functions called with Duals return
+    Duals carrying the exact derivatives. The math module converts its arguments to float,
+    which raises TypeError, use numpy or mathutils.dmath functions instead.
+
+    Parameters
+    ----------
+    value : scalar or ndarray of shape V
+    derivatives : ndarray of shape (P,) + V
+        derivatives with respect to the P seed directions
+    """
+
+    def __init__(self, value, derivatives):
+
+        self.value = value
+        self.derivatives = np.asarray(derivatives, dtype=float)
+
+    @classmethod
+    def variables(cls, values):
+        """
+        Returns list of Duals, one for each of the N values, seeded so that the derivatives of
+        a result are its partial derivatives with respect to the values. Values can be arrays,
+        the derivatives then have shape (N,) + shape of the result.
+        """
+
+        n = len(values)
+        variables = []
+
+        for i, value in enumerate(values):
+            value = np.asarray(value, dtype=float)
+            derivatives = np.zeros((n,) + value.shape)
+            derivatives[i] = 1
+            variables.append(cls(value if value.ndim else float(value), derivatives))
+
+        return variables
+
+    # ----- ARITHMETIC ----- #
+
+    def __add__(self, second):
+
+        return np.add(self, second)
+
+    def __radd__(self, first):
+
+        return np.add(first, self)
+
+    def __sub__(self, second):
+
+        return np.subtract(self, second)
+
+    def __rsub__(self, first):
+
+        return np.subtract(first, self)
+
+    def __mul__(self, second):
+
+        return np.multiply(self, second)
+
+    def __rmul__(self, first):
+
+        return np.multiply(first, self)
+
+    def __truediv__(self, second):
+
+        return np.true_divide(self, second)
+
+    def __rtruediv__(self, first):
+
+        return np.true_divide(first, self)
+
+    def __pow__(self, exponent):
+
+        return np.power(self, exponent)
+
+    def __rpow__(self, base):
+
+        return np.power(base, self)
+
+    def __neg__(self):
+
+        return Dual(-self.value, -self.derivatives)
+
+    def __pos__(self):
+
+        return self
+
+    def __abs__(self):
+
+        return np.absolute(self)
+
+    # ----- COMPARISONS, by value ----- #
+
+    def __lt__(self, second):
+
+        return self.value < _value(second)
+
+    def __le__(self, second):
+
+        return self.value <= _value(second)
+
+    def __gt__(self, second):
+
+        return self.value > _value(second)
+
+    def __ge__(self, second):
+
+        return self.value >= _value(second)
+
+    def __float__(self):
+
+        raise TypeError("Dual can not be converted to float without losing derivatives, "
+                        "use numpy or mathutils.dmath functions instead of math.")
+
+    # ----- CONTAINER ----- #
+
+    def __len__(self):
+
+        return len(self.value)
+
+    def __getitem__(self, index):
+
+        if not isinstance(index, tuple):
+            index = (index,)
+        return Dual(self.value[index], self.derivatives[(slice(None),) + index])
+
+    # ----- NUMPY ----- #
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+
+        if method != "__call__" or kwargs:
+            return NotImplemented
+
+        if len(inputs) == 1 and ufunc in _UNARY:
+            x = inputs[0]
+            return Dual(ufunc(x.value), x.derivatives * _UNARY[ufunc](x.value))
+
+        if len(inputs) == 2 and ufunc in _BINARY:
+            return _BINARY[ufunc](*(_split(x) for x in inputs))
+
+        return NotImplemented
+
+    def __repr__(self):
+
+        return f"Dual(value={self.value!r}, derivatives={self.derivatives!r})"
+
+
+def _value(x):
+
+    return x.value if isinstance(x, Dual) else x
+
+
+def _split(x):
+    """ Returns (value, derivatives), derivatives are None for constants. """
+
+    if isinstance(x, Dual):
+        return x.value, x.derivatives
+    return x, None
+
+
+def _combine(value, *terms):
+    """ Dual with derivatives sum of d * factor over (d, factor) terms with d not None. """
+
+    ndim = np.ndim(value)
+    derivatives = 0
+    for d, factor in terms:
+        if d is not None:
+            # align value axes of d to the right, the first axis are the seed directions
+            d = d.reshape(d.shape[:1] + (1,) * (ndim - d.ndim + 1) + d.shape[1:])
+            derivatives = derivatives + d * factor
+
+    return Dual(value, derivatives)
+
+
+def _add(a, b):
+
+    return _combine(a[0] + b[0], (a[1], 1), (b[1], 1))
+
+
+def _subtract(a, b):
+
+    return _combine(a[0] - b[0], (a[1], 1), (b[1], -1))
+
+
+def _multiply(a, b):
+
+    return _combine(a[0] * b[0], (a[1], b[0]), (b[1], a[0]))
+
+
+def _divide(a, b):
+
+    value = a[0] / b[0]
+    return _combine(value, (a[1], 1 / b[0]), (b[1], -value / b[0]))
+
+
+def _power(a, b):
+
+    value = np.power(a[0], b[0])
+    terms = [(a[1], b[0] * np.power(a[0], b[0] - 1))]
+    if b[1] is not None:
+        terms.append((b[1], value * np.log(a[0])))
+
+    return _combine(value, *terms)
+
+
+def _arctan2(a, b):
+
+    r2 = a[0]**2 + b[0]**2
+    return _combine(np.arctan2(a[0], b[0]), (a[1], b[0] / r2), (b[1], -a[0] / r2))
+
+
+def _hypot(a, b):
+
+    value = np.hypot(a[0], b[0])
+    return _combine(value, (a[1], a[0] / value), (b[1], b[0] / value))
+
+
+# derivative of f expressed by the value of the argument
+_UNARY = {
+    np.negative: lambda x: -1,
+    np.positive: lambda x: 1,
+    np.absolute: np.sign,
+    np.square: lambda x: 2 * x,
+    np.sqrt: lambda x: 0.5 / np.sqrt(x),
+    np.cbrt: lambda x: 1 / (3 * np.cbrt(x)**2),
+    np.reciprocal: lambda x: -1 / x**2,
+    np.exp: np.exp,
+    np.exp2: lambda x: np.log(2) * np.exp2(x),
+    np.expm1: np.exp,
+    np.log: lambda x: 1 / x,
+    np.log2: lambda x: 1 / (x * np.log(2)),
+    np.log10: lambda x: 1 / (x * np.log(10)),
+    np.log1p: lambda x: 1 / (1 + x),
+    np.sin: np.cos,
+    np.cos: lambda x: -np.sin(x),
+    np.tan: lambda x: 1 / np.cos(x)**2,
+    np.arcsin: lambda x: 1 / np.sqrt(1 - x**2),
+    np.arccos: lambda x: -1 / np.sqrt(1 - x**2),
+    np.arctan: lambda x: 1 / (1 + x**2),
+    np.sinh: np.cosh,
+    np.cosh: np.sinh,
+    np.tanh: lambda x: 1 - np.tanh(x)**2,
+    np.arcsinh: lambda x: 1 / np.sqrt(x**2 + 1),
+    np.arccosh: lambda x: 1 / np.sqrt(x**2 - 1),
+    np.arctanh: lambda x: 1 / (1 - x**2),
+    np.deg2rad: lambda x: np.pi / 180,
+    np.rad2deg: lambda x: 180 / np.pi,
+}
+
+_BINARY = {
+    np.add: _add,
+    np.subtract: _subtract,
+    np.multiply: _multiply,
+    np.true_divide: _divide,
+    np.power: _power,
+    np.arctan2: _arctan2,
+    np.hypot: _hypot,
+}
+
+
+def derivatives(f, arguments):
+    """
+    Calculates value and all partial derivatives of f(a1, a2, a3,...) at arguments exactly
+    in one evaluation of f with Dual arguments. Arguments can be arrays (broadcast together).
+
+    Returns
+    -------
+    value : scalar or ndarray
+    partials : ndarray of shape (N,) + shape of value
+
+    Raises
+    ------
+    TypeError
+        if f can not be evaluated with Duals, e.g. it uses the math module
+    """
+
+    variables = Dual.variables(arguments)
+    result = f(*variables)
+
+    if isinstance(result, Dual):
+        shape = np.shape(result.value)
+        return result.value, np.broadcast_to(result.derivatives, (len(arguments),) + shape)
+
+    if isinstance(result, np.ndarray) and result.dtype == object:
+        raise TypeError("f returned array of Duals, only scalar results are supported.")
+
+    # f does not depend on the arguments
+    return result, np.zeros((len(arguments),) + np.shape(result))
@@ -0,0 +1,361 @@
+from math import factorial
+
+import numpy as np
+
+from ._cache import EvaluationCache
+from ._parallel import executor_for
+
+
+def central_difference_weights(n=1, order=2):
+    """
+    Calculates the central finite difference stencil for n-th derivative.
+
+    Parameters
+    ----------
+    n : int
+        order of the derivative
+    order : even int
+        order of accuracy, the error is O(dx**order)
+
+    Returns
+    -------
+    offsets : ndarray of ints
+        positions of the stencil points in units of dx, points with zero weight are left out
+    weights : ndarray
+        the derivative is sum(weights * f(x + offsets * dx)) / dx**n
+    """
+
+    if order < 2 or order % 2:
+        raise ValueError("Order of accuracy must be an even number >= 2.")
+
+    half_width = (n + order - 1) // 2
+    offsets = np.arange(-half_width, half_width + 1)
+
+    # sum_k w_k * k**m = n! * delta(m, n) for m = 0..2*half_width
+    vandermonde = offsets[np.newaxis, :]**np.arange(len(offsets))[:, np.newaxis]
+    rhs = np.zeros(len(offsets))
+    rhs[n] = factorial(n)
+    weights = np.linalg.solve(vandermonde.astype(float), rhs)
+
+    nonzero = np.abs(weights) > 1e-12 * np.abs(weights).max()
+    return offsets[nonzero], weights[nonzero]
+
+
+def _evaluate_points(f, points, vectorized=None, cache=None, executor=None):
+    """
+    Evaluates f at every row of points. With cache (EvaluationCache), only the points
+    not found in the cache are evaluated. With executor (int or Executor, see
+    mathutils._parallel.executor_for), f is called for every point separately in parallel,
+    the result is identical to vectorized=False.
+
+    Parameters
+    ----------
+    f : callable, N arguments
+    points : (K, N) array
+    vectorized : None or bool
+        If True, f is called once with N arrays of length K and has to return array with
+        last axis of length K. If False, f is called K times. If None, the vectorized call
+        is tried first and the loop is used if it fails or returns wrong shape.
+
+    Returns
+    -------
+    (K, ...) ndarray of f values
+    """
+
+    points = np.asarray(points, dtype=float)
+    k = len(points)
+
+    if cache is not None:
+        keys = [tuple(point) for point in points.tolist()]
+        found = [cache.lookup(f, key) for key in keys]
+        missing = [i for i, (is_found, _) in enumerate(found) if not is_found]
+
+        values = [value for _, value in found]
+        if missing:
+            new_values = _evaluate_points(f, points[missing], vectorized, executor=executor)
+            for i, value in zip(missing, new_values):
+                cache.store(f, keys[i], value)
+                values[i] = value
+
+        return np.array(values, dtype=float)
+
+    if executor:
+        executor, owned = executor_for(executor, f)
+        try:
+            values = list(executor.map(f, *points.T.tolist()))
+        finally:
+            if owned:
+                executor.shutdown()
+
+        if any(value is None for value in values):
+            raise Exception("f doesn't have a return value")
+
+        return np.array(values, dtype=float)
+
+    if vectorized or vectorized is None:
+        try:
+            values = f(*points.T)
+        except Exception:
+            if vectorized:
+                raise
+        else:
+            values = np.asarray(values)
+            if values.ndim and values.shape[-1] == k:
+                return np.moveaxis(values, -1, 0)
+            if vectorized:
+                raise ValueError("Vectorized f returned array of wrong shape.")
+
+    values = [f(*point) for point in points.tolist()]
+
+    if any(value is None for value in values):
+        raise Exception("f doesn't have a return value")
+
+    return np.array(values, dtype=float)
+
+
+def jacobian(f, args, dx=1e-6, n=1, order=2, vectorized=None, cache=None, executor=None):
+    """
+    Calculates all partial derivatives of function f(a1, a2, a3,...) at args by central
+    differences. All stencil points are evaluated in one call if f works on numpy arrays,
+    see _evaluate_points.
+
+    Parameters
+    ----------
+    f : callable, N arguments
+        function to differentiate, returns scalar or array of shape S
+    args : N-sequence
+        arguments to f
+    dx : float or N-sequence
+        step, can be different for every argument
+    n : int
+        order of the derivatives
+    order : even int
+        order of accuracy of the central difference
+    vectorized : None or bool
+        see _evaluate_points
+    cache : EvaluationCache, optional
+        memoizes the evaluations of f
+    executor : None, int or concurrent.futures.Executor
+        evaluates the stencil points in parallel, by worker processes (int) or the given
+        executor. f that can not be pickled for processes is run in threads.
+
+    Returns
+    -------
+    ndarray of shape S + (N,), [..., i] is the derivative with respect to args[i]
+    """
+
+    args = np.asarray(args, dtype=float)
+    dx = np.broadcast_to(np.asarray(dx, dtype=float), args.shape)
+    offsets, weights = central_difference_weights(n, order)
+
+    # row i * len(offsets) + j is args with args[i] shifted by offsets[j] * dx[i]
+    shifts = np.einsum("ij,k->ikj", np.diag(dx), offsets).reshape(-1, len(args))
+    values = _evaluate_points(f, args + shifts, vectorized, cache, executor)
+    values = values.reshape((len(args), len(offsets)) + values.shape[1:])
+
+    derivatives = np.tensordot(weights, values, axes=(0, 1))
+    derivatives = derivatives / dx.reshape((-1,) + (1,) * (derivatives.ndim - 1))**n
+
+    return np.moveaxis(derivatives, 0, -1)
+
+
+def gradient(f, args, dx=1e-6, n=1, order=2, vectorized=None, cache=None, executor=None):
+    """
+    Calculates partial derivatives of scalar function f(a1, a2, a3,...) with respect to all
+    arguments at args. See jacobian for the parameters.
+
+    Returns
+    -------
+    N-length ndarray
+    """
+
+    derivatives = jacobian(f, args, dx, n, order, vectorized, cache, executor)
+    if derivatives.ndim != 1:
+        raise ValueError("f is not a scalar function, use jacobian.")
+
+    return derivatives
+
+
+class _CountingCache:
+    """
+    Evaluates f at argument tuples, remembering the values and counting the new calls.
+    cache is a dict or EvaluationCache.
+    """
+
+    def __init__(self, f, cache):
+
+        self.f = f
+        self.cache = {} if cache is None else cache
+        self.evaluations = 0
+
+    def _contains(self, key):
+
+        if isinstance(self.cache, EvaluationCache):
+            return self.cache.contains(self.f, key)
+        return key in self.cache
+
+    def missing(self, keys):
+
+        return len({key for key in keys if not self._contains(key)})
+
+    def __call__(self, key):
+
+        if isinstance(self.cache, EvaluationCache):
+            found, value = self.cache.lookup(self.f, key)
+        else:
+            found = key in self.cache
+            value = self.cache.get(key)
+
+        if not found:
+            value = self.f(*key)
+            if value is None:
+                raise Exception("f doesn't have a return value")
+
+            if isinstance(self.cache, EvaluationCache):
+                self.cache.store(self.f, key, value)
+            else:
+                self.cache[key] = value
+            self.evaluations += 1
+
+        return value
+
+
+def _richardson(evaluate, point, index, step, n, order, factor, max_evaluations, tolerance):
+    """
+    Richardson extrapolation of central differences with steps step / factor**k, see
+    derivative_adaptive. evaluate is _CountingCache, point the argument tuple and index
+    the position of the differentiated argument.
+    """
+
+    offsets, weights = central_difference_weights(n, order)
+
+    def key(offset, h):
+
+        shifted = list(point)
+        shifted[index] = point[index] + offset * h
+        return tuple(shifted)
+
+    table = []
+    best, best_error = None, np.inf
+    rising = 0
+
+    for level in range(64):
+        h = step / factor**level
+        keys = [key(offset, h) for offset in offsets]
+
+        if evaluate.evaluations + evaluate.missing(keys) > max_evaluations:
+            break
+
+        row = [np.dot(weights, [evaluate(k) for k in keys]) / h**n]
+        # error of central differences is a series in even powers of h
+        for j in range(1, len(table) + 1):
+            scale = factor**(order + 2 * (j - 1))
+            row.append(row[j - 1] + (row[j - 1] - table[-1][j - 1]) / (scale - 1))
+
+        if table:
+            error = max(abs(row[-1] - table[-1][-1]), abs(row[-1] - row[-2]))
+            if error < best_error:
+                best, best_error = row[-1], error
+                rising = 0
+            else:
+                # rounding errors started to dominate
+                rising += 1
+                if rising >= 2:
+                    break
+
+            if best_error <= tolerance * abs(best):
+                break
+
+        table.append(row)
+
+    if best is None:
+        if not table:
+            raise ValueError("max_evaluations is too low for a single difference.")
+        best = table[-1][-1]
+
+    return best, best_error
+
+
+def derivative_adaptive(f, x, n=1, step=None, factor=2, order=4, max_evaluations=100,
+                        tolerance=1e-12, cache=None):
+    """
+    Calculates n-th derivative of f at x with adaptive step. Central differences with steps
+    step / factor**k for k = 0, 1, 2... are combined by Richardson extrapolation until the
+    estimated error drops below tolerance, stops decreasing or max_evaluations of f would
+    be exceeded. With the default factor 2 and order 4 the stencil points +-h of a level are
+    the points +-2h of the next one, so every further level of the first derivative costs
+    2 new evaluations of f instead of 4 (order 2 shares no points between levels).
+
+    Parameters
+    ----------
+    f : callable, one argument
+    x : float
+    n : int
+        order of the derivative
+    step : float, optional
+        initial (largest) step, 0.1 * max(1, |x|) by default
+    factor : float
+        ratio of successive steps
+    order : even int
+        order of accuracy of the underlying central difference, at least 4 for reuse of
+        the evaluations between levels
+    max_evaluations : int
+        maximum number of new calls of f
+    tolerance : float
+        relative error to stop at
+    cache : dict or EvaluationCache, optional
+        dict maps argument tuples to values of f, (x,) -> f(x). Pass the same cache to
+        successive calls to reuse the evaluations, it is filled in place.
+
+    Returns
+    -------
+    derivative : float
+    error : float
+        estimated absolute error of the derivative (inf if only one level was affordable)
+    """
+
+    return partial_derivative_adaptive(f, 0, [x], n, step, factor, order, max_evaluations,
+                                       tolerance, cache)
+
+
+def partial_derivative_adaptive(f, with_respect_to, arguments, n=1, step=None, factor=2, order=4,
+                                max_evaluations=100, tolerance=1e-12, cache=None):
+    """
+    Calculates partial derivative of f(a1, a2, a3,...) with respect to the argument in position
+    with_respect_to with adaptive step, see derivative_adaptive for the parameters.
+
+    Returns
+    -------
+    derivative : float
+    error : float
+    """
+
+    point = tuple(float(argument) for argument in arguments)
+    if step is None:
+        step = 0.1 * max(1, abs(point[with_respect_to]))
+
+    evaluate = _CountingCache(f, cache)
+    return _richardson(evaluate, point, with_respect_to, step, n, order, factor,
+                       max_evaluations, tolerance)
+
+
+def gradient_adaptive(f, args, n=1, step=None, factor=2, order=4, max_evaluations=400,
+                      tolerance=1e-12, cache=None):
+    """
+    Calculates partial derivatives of f(a1, a2, a3,...) with respect to all arguments with
+    adaptive steps, see derivative_adaptive for the parameters. max_evaluations is the budget
+    for all of them together, split evenly, and the evaluations are shared through cache.
+
+    Returns
+    -------
+    derivatives : N-length ndarray
+    errors : N-length ndarray
+    """
+
+    cache = {} if cache is None else cache
+    budget = max_evaluations // len(args)
+    results = [partial_derivative_adaptive(f, i, args, n, step, factor, order, budget,
+                                           tolerance, cache)
+               for i in range(len(args))]
+
+    return tuple(np.array(values) for values in zip(*results))
@@ -0,0 +1,67 @@
+import pickle
+import warnings
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import chain, islice
+
+
+def executor_for(workers, f):
+    """
+    Returns (executor, owned) for workers, which is an int (number of worker processes)
+    or an Executor. Process pools can only run picklable f (or whatever object is passed
+    to be sent to the workers), for unpicklable ones (lambdas, closures) a thread pool of
+    the same size is used instead, with a warning.
+    owned means the executor was created here and has to be shut down by the caller.
+    """
+
+    if isinstance(workers, Executor):
+        executor, owned = workers, False
+    else:
+        executor, owned = ProcessPoolExecutor(workers), True
+
+    if isinstance(executor, ProcessPoolExecutor):
+        try:
+            pickle.dumps(f)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            warnings.warn("Function can not be pickled for worker processes, using threads.")
+            size = executor._max_workers
+            if owned:
+                executor.shutdown()
+            executor, owned = ThreadPoolExecutor(size), True
+
+    return executor, owned
+
+
+def map_bounded(function, tasks, workers):
+    """
+    Yields function(*task) for tasks in order. With workers (int or Executor, see
+    executor_for), the tasks run in parallel, at most 2 tasks per worker are in flight,
+    so finished results do not pile up.
+    """
+
+    if not workers:
+        for task in tasks:
+            yield function(*task)
+        return
+
+    tasks = iter(tasks)
+    first = next(tasks, None)
+    if first is None:
+        return
+
+    # arguments of the tasks have to be picklable as well, e.g. functions passed in them
+    executor, owned = executor_for(workers, (function, first))
+    in_flight = 2 * getattr(executor, "_max_workers", 1)
+
+    try:
+        tasks = chain([first], tasks)
+        futures = [executor.submit(function, *task) for task in islice(tasks, in_flight)]
+
+        while futures:
+            result = futures.pop(0).result()
+            for task in tasks:
+                futures.append(executor.submit(function, *task))
+                break
+            yield result
+    finally:
+        if owned:
+            executor.shutdown(cancel_futures=True)
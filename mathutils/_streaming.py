@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class RunningMoments:
+    """
+    Streaming mean and variance of data arriving in batches (Chan's parallel algorithm),
+    memory is constant. Partial results can be merged, e.g. from worker processes.
+    Data can be scalars or arrays of fixed shape, the statistics are then elementwise.
+    """
+
+    def __init__(self):
+
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, batch):
+        """ Adds batch of samples, the first axis is the sample axis. """
+
+        batch = np.asarray(batch, dtype=float)
+        if not len(batch):
+            return
+
+        other = RunningMoments()
+        other.count = len(batch)
+        other.mean = batch.mean(axis=0)
+        other._m2 = ((batch - other.mean)**2).sum(axis=0)
+
+        self.merge(other)
+
+    def merge(self, other):
+        """ Adds statistics of other RunningMoments. """
+
+        if not other.count:
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+
+        self.mean = self.mean + delta * other.count / count
+        self._m2 = self._m2 + other._m2 + delta**2 * self.count * other.count / count
+        self.count = count
+
+    def variance(self, ddof=1):
+
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof=1):
+
+        return np.sqrt(self.variance(ddof))
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantiles of streaming scalar data with constant memory. The data are
+    summarized by at most 2 * size weighted points (equal weight groups of sorted data), so
+    the quantiles have error of about 1 / size in rank.
+    """
+
+    def __init__(self, size=1000):
+
+        self.size = size
+        self._values = np.empty(0)
+        self._weights = np.empty(0)
+
+    @property
+    def count(self):
+
+        return self._weights.sum()
+
+    def update(self, batch):
+        """ Adds batch of samples. """
+
+        batch = np.ravel(np.asarray(batch, dtype=float))
+        self._add(batch, np.ones(len(batch)))
+
+    def merge(self, other):
+        """ Adds data summarized by other QuantileSketch. """
+
+        self._add(other._values, other._weights)
+
+    def _add(self, values, weights):
+
+        values = np.concatenate((self._values, values))
+        weights = np.concatenate((self._weights, weights))
+
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+
+        if len(values) > 2 * self.size:
+            # groups of equal total weight, each replaced by its weighted mean
+            cumulative = np.cumsum(weights) - weights / 2
+            groups = np.minimum((cumulative / weights.sum() * self.size).astype(int), self.size - 1)
+
+            weights_sum = np.bincount(groups, weights, minlength=self.size)
+            values_sum = np.bincount(groups, weights * values, minlength=self.size)
+            nonempty = weights_sum > 0
+
+            values = values_sum[nonempty] / weights_sum[nonempty]
+            weights = weights_sum[nonempty]
+
+        self._values, self._weights = values, weights
+
+    def quantile(self, q):
+        """ Returns approximate q-quantile(s), q in [0, 1]. """
+
+        cumulative = (np.cumsum(self._weights) - self._weights / 2) / self._weights.sum()
+        return np.interp(q, cumulative, self._values)
@@ -0,0 +1,194 @@
+import inspect
+import math
+import types
+
+import numpy as np
+import sympy
+
+from ._cache import _function_fingerprint, _Unstable
+
+# numpy/math names that differ from sympy ones
+_SYMPY_NAMES = {
+    "arcsin": "asin",
+    "arccos": "acos",
+    "arctan": "atan",
+    "arctan2": "atan2",
+    "arcsinh": "asinh",
+    "arccosh": "acosh",
+    "arctanh": "atanh",
+    "absolute": "Abs",
+    "fabs": "Abs",
+    "abs": "Abs",
+    "power": "Pow",
+    "pow": "Pow",
+    "e": "E",
+}
+
+
+class _SympyNamespace:
+    """ Stands in for math, numpy or dmath modules when a function is traced symbolically. """
+
+    def __getattr__(self, name):
+
+        return _sympy_function(name)
+
+
+def _sympy_function(name):
+
+    if name == "expm1":
+        return lambda x: sympy.exp(x) - 1
+    if name == "log1p":
+        return lambda x: sympy.log(1 + x)
+    if name in ("log10", "log2"):
+        return lambda x: sympy.log(x, int(name[3:]))
+    if name == "square":
+        return lambda x: x**2
+
+    try:
+        return getattr(sympy, _SYMPY_NAMES.get(name, name))
+    except AttributeError:
+        raise TypeError(f"Function {name} has no symbolic counterpart.") from None
+
+
+def _is_numeric_module(value):
+
+    return isinstance(value, types.ModuleType) and (
+        value is math or value is np or value.__name__.split(".")[0] in ("numpy", "scipy")
+        or value.__name__.endswith("mathutils.dmath"))
+
+
+def _is_numeric_function(value):
+
+    return isinstance(value, np.ufunc) or getattr(value, "__module__", None) == "math"
+
+
+def trace(f):
+    """
+    Converts Python function of N arguments to sympy expression and list of N symbols named as
+    the arguments. f may use arithmetic operators and functions of math, numpy, scipy or
+    mathutils.dmath (as module attributes or imported names), they are replaced by their
+    sympy counterparts.
+    """
+
+    names = list(inspect.signature(f).parameters)
+    symbols = [sympy.Symbol(name, real=True) for name in names]
+
+    namespace = _SympyNamespace()
+    globals_ = {}
+    for name, value in f.__globals__.items():
+        if _is_numeric_module(value):
+            value = namespace
+        elif _is_numeric_function(value):
+            value = _sympy_function(value.__name__)
+        globals_[name] = value
+
+    traced = types.FunctionType(f.__code__, globals_, f.__name__, f.__defaults__, f.__closure__)
+    return sympy.sympify(traced(*symbols)), symbols
+
+
+class SymbolicPropagation:
+    """
+    Compiled uncertainty propagation of a symbolic expression, created by
+    uncertainty.up_symbolic. Calling it with argument values and their uncertainties (scalars
+    or arrays, broadcast together) returns (value, uncertainty) computed by one fused
+    numpy function.
+
+    Attributes
+    ----------
+    expression : sympy expression
+    variables : list of sympy symbols
+    partials : list of sympy expressions, derivatives with respect to the variables
+    uncertainty : sympy expression of the propagated uncertainty, the uncertainty of
+        variable x is the symbol u_x
+    """
+
+    def __init__(self, expression, variables):
+
+        self.expression = expression
+        self.variables = list(variables)
+        self.partials = [sympy.diff(expression, v) for v in self.variables]
+
+        uncertainties = [sympy.Symbol(f"u_{v.name}", nonnegative=True) for v in self.variables]
+        self.uncertainty = sympy.sqrt(sum((p * u)**2 for p, u in zip(self.partials, uncertainties)))
+
+        # cse shares subexpressions of the value and the partials in the generated code
+        self._function = sympy.lambdify(self.variables + uncertainties,
+                                        [self.expression, self.uncertainty],
+                                        modules="numpy", cse=True)
+
+    def __call__(self, arguments, arg_uncertainties):
+
+        if len(arguments) != len(self.variables) or len(arg_uncertainties) != len(self.variables):
+            raise ValueError(f"Expected {len(self.variables)} arguments and uncertainties.")
+
+        arrays = np.broadcast_arrays(*(np.asarray(a, dtype=float)
+                                       for a in list(arguments) + list(arg_uncertainties)))
+        value, uncertainty = self._function(*arrays)
+
+        shape = arrays[0].shape
+        return np.broadcast_to(value, shape)[()], np.broadcast_to(uncertainty, shape)[()]
+
+    def __repr__(self):
+
+        return f"SymbolicPropagation({self.expression})"
+
+
+_compiled = {}
+
+
+def _resolve(expression, variables):
+    """
+    Symbols of expression for variables (symbols or names), matched by name, so that names
+    find e.g. the real symbols made by trace.
+    """
+
+    symbols = {symbol.name: symbol for symbol in expression.free_symbols}
+    resolved = []
+    for variable in variables:
+        name = variable if isinstance(variable, str) else variable.name
+        if name not in symbols:
+            raise ValueError(f"Variable {name} is not in the expression {expression}.")
+        resolved.append(symbols[name])
+
+    return resolved
+
+
+def _compile(expression, variables):
+
+    key = ("expression", sympy.srepr(expression), tuple(sympy.srepr(v) for v in variables))
+    if key not in _compiled:
+        _compiled[key] = SymbolicPropagation(expression, variables)
+
+    return _compiled[key]
+
+
+def compile_propagation(expression, variables=None):
+    """ See uncertainty.up_symbolic. """
+
+    names = None if variables is None else tuple(
+        v if isinstance(v, str) else v.name for v in variables)
+
+    if callable(expression) and not isinstance(expression, sympy.Basic):
+        try:
+            function_key = ("function", _function_fingerprint(expression), names)
+        except _Unstable:
+            function_key = None
+
+        if function_key in _compiled:
+            return _compiled[function_key]
+
+        traced, traced_variables = trace(expression)
+        variables = traced_variables if names is None else _resolve(traced, names)
+        result = _compile(traced, variables)
+
+        if function_key is not None:
+            _compiled[function_key] = result
+        return result
+
+    expression = sympy.sympify(expression)
+    if names is None:
+        variables = sorted(expression.free_symbols, key=lambda s: s.name)
+    else:
+        variables = _resolve(expression, names)
+
+    return _compile(expression, variables)
@@ -0,0 +1,10 @@
+"""
+Counterpart of the math module that works with mathutils.Dual (and numpy arrays),
+analogous to uncertainties.umath. Write functions with these instead of math to get exact
+derivatives in mathutils.uncertainty.up_function.
+"""
+from numpy import (sqrt, cbrt, exp, expm1, log, log1p, log2, log10, sin, cos, tan,
+                   arcsin as asin, arccos as acos, arctan as atan, arctan2 as atan2,
+                   sinh, cosh, tanh, arcsinh as asinh, arccosh as acosh, arctanh as atanh,
+                   hypot, pi, e, inf, nan, deg2rad as radians, rad2deg as degrees)
+from numpy import absolute as fabs
@@ -1,34 +1,473 @@
 # from custom_utils.science.imports import *
-import scipy as sp
-from custom_utils.math import partial_derivative
+import numpy as np
+from custom_utils.mathutils import gradient, derivatives, central_difference_weights
+from custom_utils.mathutils import RunningMoments, QuantileSketch
+from custom_utils.mathutils._parallel import map_bounded
 
 
-def up_function(f, arguments, arg_uncertainties):
+def _partials(f, arguments, method, vectorized, cache=None, executor=None):
+    """ Partial derivatives of f at arguments, by automatic differentiation if possible. """
 
-    f_uncertainty_sqr = 0
+    if method not in ("auto", "ad", "fd"):
+        raise ValueError('Value of method must be "auto", "ad" or "fd".')
 
-    for i in range(len(arguments)):
-        partial = partial_derivative(f, i, arguments)
-        f_uncertainty_sqr += partial**2 * arg_uncertainties[i]**2
+    # AD is a single evaluation of f, there is nothing to run in parallel or to memoize
+    if executor is not None or cache is not None:
+        if method == "ad":
+            raise ValueError('Cache and executor can not be used with method "ad".')
+        method = "fd"
 
-    return sp.sqrt(f_uncertainty_sqr)
+    if method != "fd":
+        try:
+            return derivatives(f, arguments)[1]
+        except Exception:
+            # f can not be traced with Duals, unless "ad" was requested explicitly
+            if method == "ad":
+                raise
 
+    return gradient(f, arguments, vectorized=vectorized, cache=cache, executor=executor)
 
-def up_add(u1, u2):
 
-    return sp.sqrt(u1**2 + u2**2)
+def up_function(f, arguments, arg_uncertainties, vectorized=None, method="auto", cache=None,
+                executor=None):
+    """
+    Propagates uncertainties of independent arguments through f(a1, a2, a3,...),
+    sqrt(sum((df/da_i * u_i)**2)).
 
+    Parameters
+    ----------
+    f : callable, N arguments
+    arguments : N-sequence
+    arg_uncertainties : N-sequence
+    vectorized : None or bool
+        see mathutils.gradient, used for finite differences
+    method : "auto", "ad" or "fd"
+        "ad" calculates exact partial derivatives by one evaluation of f with mathutils.Dual
+        arguments (f has to use numpy or mathutils.dmath functions, not math), "fd" uses
+        finite differences (mathutils.gradient), "auto" tries "ad" and falls back to "fd",
+        it uses "fd" directly if cache or executor is passed.
+    cache : mathutils.EvaluationCache, optional
+        memoizes the evaluations of f for finite differences, ValueError is raised with
+        method "ad"
+    executor : None, int or concurrent.futures.Executor
+        evaluates the finite difference stencil points in parallel, see mathutils.gradient,
+        ValueError is raised with method "ad"
+    """
 
-def up_multiply(v1, v2, u1, u2):
+    partials = _partials(f, arguments, method, vectorized, cache, executor)
+    f_uncertainty_sqr = np.sum(partials**2 * np.asarray(arg_uncertainties)**2)
 
-    return sp.sqrt((v2 * u1)**2 + (v1 * u2)**2)
+    return np.sqrt(f_uncertainty_sqr)
+
+
+def _partials_array(f, columns, method, dx):
+    """
+    Values and partial derivatives of f at every row of columns (arrays broadcast together),
+    shape of partials is (N,) + shape of the rows.
+    """
+
+    if method not in ("auto", "ad", "fd"):
+        raise ValueError('Value of method must be "auto", "ad" or "fd".')
+
+    if method != "fd":
+        try:
+            return derivatives(f, columns)
+        except Exception:
+            if method == "ad":
+                raise
+
+    columns = list(np.broadcast_arrays(*columns))
+    offsets, weights = central_difference_weights()
+
+    try:
+        values = np.asarray(f(*columns), dtype=float)
+    except Exception:
+        # f does not work on arrays, row by row, with the same relative steps as below
+        rows = np.stack([column.ravel() for column in columns], axis=-1)
+        partials = np.array([gradient(f, row, dx=dx * np.maximum(1, np.abs(row)),
+                                      vectorized=False) for row in rows]).T
+        values = np.array([f(*row) for row in rows.tolist()])
+
+        return values.reshape(columns[0].shape), partials.reshape((-1,) + columns[0].shape)
+
+    # every stencil point is one call of f over whole columns
+    partials = np.zeros((len(columns),) + np.broadcast_shapes(values.shape, columns[0].shape))
+    for i, column in enumerate(columns):
+        step = dx * np.maximum(1, np.abs(column))
+        for offset, weight in zip(offsets, weights):
+            shifted = columns[:i] + [column + offset * step] + columns[i + 1:]
+            partials[i] += weight * f(*shifted)
+        partials[i] /= step
+
+    return values, partials
+
+
+def _like(result, templates):
+    """ Wraps result into pandas Series if there is one among templates, with its index. """
+
+    for template in templates:
+        if hasattr(template, "index") and hasattr(template, "to_numpy"):
+            return type(template)(result, index=template.index)
+
+    return result
+
+
+def up_function_array(f, arguments, arg_uncertainties, method="auto", dx=1e-6, out=None):
+    """
+    Propagates uncertainties of independent arguments through f(a1, a2, a3,...) for many points
+    at once, e.g. rows of a measurement table. f is evaluated on whole columns and partial
+    derivatives are calculated for every row in a vectorized way.
+
+    Parameters
+    ----------
+    f : callable, N arguments
+        should work on numpy arrays, otherwise it is evaluated row by row
+    arguments : N-sequence of arrays or pandas Series
+        columns of argument values, broadcast together to M rows
+    arg_uncertainties : N-sequence of arrays, Series or scalars
+        uncertainties of the arguments, broadcast against the columns
+    method : "auto", "ad" or "fd"
+        see up_function
+    dx : float
+        relative step of finite differences, the step is dx * max(1, |a_i|)
+    out : None or (ndarray, ndarray)
+        buffers for values and uncertainties
+
+    Returns
+    -------
+    values : ndarray or Series
+        values of f in every row, Series with the index of the first Series argument
+    uncertainties : ndarray or Series
+        propagated uncertainties in every row
+    """
+
+    columns = [np.asarray(argument, dtype=float) for argument in arguments]
+    values, partials = _partials_array(f, columns, method, dx)
+
+    uncertainties = np.broadcast_arrays(*(np.asarray(u, dtype=float) for u in arg_uncertainties))
+    f_uncertainty_sqr = np.zeros(np.shape(values))
+    for partial, uncertainty in zip(partials, uncertainties):
+        f_uncertainty_sqr += (partial * uncertainty)**2
+
+    if out is not None:
+        value_out, uncertainty_out = out
+        np.copyto(value_out, values)
+        np.sqrt(f_uncertainty_sqr, out=uncertainty_out)
+        return value_out, uncertainty_out
+
+    return _like(values, arguments), _like(np.sqrt(f_uncertainty_sqr), arguments)
+
+
+def up_covariance(f, arguments, covariance, method="auto", dx=1e-6):
+    """
+    Propagates uncertainties of correlated arguments through f(a1, a2, a3,...),
+    the variance is J @ covariance @ J.T, where J is the jacobian. Evaluates at many points at
+    once, either arguments are columns of values (like in up_function_array) or f itself
+    returns array of values, e.g. a fitted curve evaluated at many x with the fit parameters
+    as arguments. The jacobian is calculated once for all points, the products are
+    done by BLAS.
+
+    Parameters
+    ----------
+    f : callable, N arguments
+    arguments : N-sequence of scalars or arrays
+    covariance : N x N array
+        covariance matrix of the arguments, e.g. from FitCurve.cov
+    method : "auto", "ad" or "fd"
+        see up_function
+    dx : float
+        relative step of finite differences, see up_function_array
+
+    Returns
+    -------
+    values : scalar or ndarray
+        values of f
+    uncertainties : scalar or ndarray
+        propagated uncertainties of the values
+    """
+
+    columns = [np.asarray(argument, dtype=float) for argument in arguments]
+    covariance = np.asarray(covariance, dtype=float)
+    if covariance.shape != (len(columns), len(columns)):
+        raise ValueError("Covariance matrix has to be N x N for N arguments.")
+
+    values, partials = _partials_array(f, columns, method, dx)
+
+    # rows of jacobian are the evaluation points
+    jacobian = partials.reshape(len(columns), -1).T
+    variances = np.einsum("ij,ij->i", jacobian @ covariance, jacobian)
+    uncertainties = np.sqrt(np.maximum(variances, 0)).reshape(partials.shape[1:])
+
+    # [()] makes scalars of 0-d arrays
+    return np.asarray(values)[()], uncertainties[()]
+
+
+def _evaluate_stencil(f, points, shape):
+    """
+    Values of f at every point of the stencil (list of shifted columns) in one call on stacked
+    columns, shape is (len(points),) + shape.
+    """
+
+    stacked = [np.stack(column) for column in zip(*points)]
+    try:
+        values = np.asarray(f(*stacked), dtype=float)
+    except Exception:
+        # f does not work on arrays, row by row
+        rows = zip(*(column.ravel().tolist() for column in stacked))
+        values = np.array([f(*row) for row in rows], dtype=float).reshape(stacked[0].shape)
+
+    return np.broadcast_to(values, (len(points),) + shape)
+
+
+def _hessian_array(f, columns, method, dx):
+    """
+    Values, partial derivatives and second derivatives of f at every row of columns, shapes
+    are shape of the rows, (N,) + shape and (N, N) + shape.
+    """
+
+    if method not in ("auto", "ad", "fd"):
+        raise ValueError('Value of method must be "auto", "ad" or "fd".')
+
+    columns = list(np.broadcast_arrays(*columns))
+    n, shape = len(columns), columns[0].shape
+    steps = np.stack([dx * np.maximum(1, np.abs(column)) for column in columns])
+
+    def shifted(*shifts):
+        point = list(columns)
+        for i, sign in shifts:
+            point[i] = point[i] + sign * steps[i]
+        return point
+
+    axial = [shifted((i, sign)) for i in range(n) for sign in (1, -1)]
+
+    if method != "fd":
+        try:
+            # exact gradients at x and x +- h_j, second derivatives by their central differences
+            values, partials = derivatives(f, [np.stack(c) for c in zip(columns, *axial)])
+        except Exception:
+            if method == "ad":
+                raise
+        else:
+            values = np.broadcast_to(values, (2 * n + 1,) + shape)
+            partials = np.broadcast_to(partials, (n, 2 * n + 1) + shape)
+            hessians = (partials[:, 1::2] - partials[:, 2::2]) / (2 * steps)
+            hessians = (hessians + np.swapaxes(hessians, 0, 1)) / 2
+
+            return values[0], partials[:, 0], hessians
+
+    # center, +-h_i and +-(h_i + h_j), the axial points serve both derivatives
+    diagonal = [shifted((i, sign), (j, sign)) for i in range(n) for j in range(i)
+                for sign in (1, -1)]
+    values = _evaluate_stencil(f, [columns] + axial + diagonal, shape)
+
+    center, plus, minus = values[0], values[1:2 * n + 1:2], values[2:2 * n + 1:2]
+    partials = (plus - minus) / (2 * steps)
+
+    hessians = np.empty((n, n) + shape)
+    hessians[range(n), range(n)] = (plus - 2 * center + minus) / steps**2
+    pairs = iter(values[2 * n + 1:])
+    for i in range(n):
+        for j in range(i):
+            both = next(pairs) + next(pairs)
+            hessians[i, j] = hessians[j, i] = (both - plus[i] - minus[i] - plus[j] - minus[j]
+                                               + 2 * center) / (2 * steps[i] * steps[j])
+
+    return center, partials, hessians
+
+
+def up_second_order(f, arguments, arg_uncertainties, method="auto", dx=1e-4, out=None):
+    """
+    Propagates uncertainties of independent normally distributed arguments through
+    f(a1, a2, a3,...) to second order, for many points at once like up_function_array.
+    Unlike the first order propagation, the mean of f is corrected for the curvature of f,
+
+        mean = f + 1/2 * sum(H_ii * u_i**2),
+        variance = sum((J_i * u_i)**2) + 1/2 * sum((H_ij * u_i * u_j)**2),
+
+    where J is the gradient and H the hessian of f. Both are exact for quadratic f.
+
+    Parameters
+    ----------
+    f : callable, N arguments
+        should work on numpy arrays, otherwise it is evaluated row by row
+    arguments : N-sequence of arrays or pandas Series
+        columns of argument values, broadcast together to M rows
+    arg_uncertainties : N-sequence of arrays, Series or scalars
+        uncertainties of the arguments
+    method : "auto", "ad" or "fd"
+        "ad" evaluates f once with mathutils.Dual arguments at 2N + 1 points per row and
+        differentiates the exact gradients, "fd" evaluates f once at N**2 + N + 1 points
+        per row (the axial points are shared by the gradient and the hessian), "auto" tries
+        "ad" and falls back to "fd"
+    dx : float
+        relative step of finite differences, the step is dx * max(1, |a_i|)
+    out : None or (ndarray, ndarray)
+        buffers for means and uncertainties
+
+    Returns
+    -------
+    means : ndarray or Series
+        bias corrected means of f in every row
+    uncertainties : ndarray or Series
+        propagated uncertainties in every row
+    """
+
+    columns = [np.asarray(argument, dtype=float) for argument in arguments]
+    values, partials, hessians = _hessian_array(f, columns, method, dx)
+
+    *uncertainties, _ = np.broadcast_arrays(*(np.asarray(u, dtype=float)
+                                              for u in arg_uncertainties), values)
+    variances = np.stack(uncertainties)**2
+
+    means = values + np.einsum("ii...,i...->...", hessians, variances) / 2
+    f_uncertainty_sqr = (np.einsum("i...,i...->...", partials**2, variances)
+                         + np.einsum("ij...,i...,j...->...", hessians**2, variances, variances) / 2)
+
+    if out is not None:
+        mean_out, uncertainty_out = out
+        np.copyto(mean_out, means)
+        np.sqrt(f_uncertainty_sqr, out=uncertainty_out)
+        return mean_out, uncertainty_out
+
+    return _like(means, arguments), _like(np.sqrt(f_uncertainty_sqr), arguments)
+
+
+def _monte_carlo_chunk(f, mean, factor, n, seed, sketch_size):
+    """
+    Evaluates f at n samples of the inputs, returns statistics of the results. factor are
+    standard deviations of independent inputs or a matrix with covariance factor @ factor.T.
+    """
+
+    rng = np.random.default_rng(seed)
+    normal = rng.standard_normal((n, len(mean)))
+    samples = mean + (normal * factor if factor.ndim == 1 else normal @ factor.T)
+    results = np.broadcast_to(np.asarray(f(*samples.T), dtype=float), (n,))
+
+    moments = RunningMoments()
+    moments.update(results)
+    sketch = QuantileSketch(sketch_size)
+    sketch.update(results)
+
+    return moments, sketch
+
+
+def up_monte_carlo(f, arguments, arg_uncertainties=None, covariance=None, n_samples=1_000_000,
+                   chunk_size=100_000, workers=None, seed=None, quantiles=(0.025, 0.5, 0.975),
+                   sketch_size=1000):
+    """
+    Propagates uncertainties through f(a1, a2, a3,...) by Monte Carlo, suitable also for
+    strongly nonlinear f. Arguments are normally distributed, samples are drawn in chunks
+    of chunk_size and f is evaluated on whole chunk at once (it has to work on numpy arrays).
+    The results are reduced by streaming moments and quantile sketches, so the memory does
+    not depend on n_samples. Every chunk has its own seed spawned from seed, so the result
+    is reproducible regardless of the number of workers.
+
+    Parameters
+    ----------
+    f : callable, N arguments
+    arguments : N-sequence
+        means of the arguments
+    arg_uncertainties : N-sequence, optional
+        standard deviations of independent arguments, exclusive with covariance
+    covariance : N x N array, optional
+        covariance matrix of the arguments, positive semidefinite (exact arguments with zero
+        variance are allowed)
+    n_samples : int
+    chunk_size : int
+    workers : None, int or concurrent.futures.Executor
+        None evaluates in this process, int is the number of worker processes, unpicklable
+        f (lambdas) run in threads instead
+    seed : None, int or numpy.random.SeedSequence
+    quantiles : sequence of floats in [0, 1]
+    sketch_size : int
+        resolution of the quantile sketch, see mathutils.QuantileSketch
+
+    Returns
+    -------
+    mean : float
+        mean of f
+    std : float
+        standard deviation of f, the uncertainty
+    quantiles : ndarray
+        approximate quantiles of f
+    """
+
+    mean = np.asarray(arguments, dtype=float)
+
+    if (arg_uncertainties is None) == (covariance is None):
+        raise ValueError("Exactly one of arg_uncertainties and covariance has to be passed.")
+    if covariance is None:
+        factor = np.abs(np.asarray(arg_uncertainties, dtype=float))
+    else:
+        # eigendecomposition instead of Cholesky, which fails for singular covariance
+        eigenvalues, eigenvectors = np.linalg.eigh(np.asarray(covariance, dtype=float))
+        factor = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    sizes = [chunk_size] * (n_samples // chunk_size)
+    if n_samples % chunk_size:
+        sizes.append(n_samples % chunk_size)
+
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) \
+        else np.random.SeedSequence(seed)
+    chunks = [(f, mean, factor, size, chunk_seed, sketch_size)
+              for size, chunk_seed in zip(sizes, seed_sequence.spawn(len(sizes)))]
+
+    moments = RunningMoments()
+    sketch = QuantileSketch(sketch_size)
+
+    for chunk_moments, chunk_sketch in map_bounded(_monte_carlo_chunk, chunks, workers):
+        moments.merge(chunk_moments)
+        sketch.merge(chunk_sketch)
+
+    return moments.mean, moments.std(), sketch.quantile(quantiles)
+
+
+def up_symbolic(expression, variables=None):
+    """
+    Derives the uncertainty formula of expression symbolically (exact partial derivatives) and
+    compiles value and uncertainty into one fused numpy function, fast on millions of rows.
+    The compiled result is cached by the expression, repeated calls return it immediately.
+    Requires sympy.
+
+    Parameters
+    ----------
+    expression : sympy expression, str or callable
+        Python function of N arguments may use arithmetic and functions of math, numpy,
+        scipy or mathutils.dmath, which are replaced by their sympy counterparts.
+    variables : N-sequence of sympy symbols or names, optional
+        order of the arguments, matched by name to the free symbols of the expression
+        (ValueError if missing), the arguments of the function or alphabetical order of
+        the free symbols by default
+
+    Returns
+    -------
+    compiled : mathutils._symbolic.SymbolicPropagation
+        compiled(arguments, arg_uncertainties) returns (value, uncertainty), the arguments
+        and uncertainties are N-sequences of scalars or arrays
+    """
+
+    from custom_utils.mathutils._symbolic import compile_propagation
+
+    return compile_propagation(expression, variables)
+
+
+def up_add(u1, u2, out=None):
+    """ Uncertainty of sum or difference, works elementwise on arrays. """
+
+    return np.hypot(u1, u2, out=out)
+
+
+def up_multiply(v1, v2, u1, u2, out=None):
+    """ Uncertainty of product v1 * v2, works elementwise on arrays. """
+
+    return np.hypot(v2 * u1, v1 * u2, out=out)
 
 
 def main():
 
     def fce(a, b, c):
 
-        return sp.sin(a) + sp.cos(b) + 2 * sp.sin(c)
+        return np.sin(a) + np.cos(b) + 2 * np.sin(c)
 
     p = up_function(fce, [1, 2, 3], [0.1, 0.2, 0.3])
     print(p)
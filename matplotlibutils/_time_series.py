@@ -7,6 +7,7 @@ import matplotlib.pyplot as plt
 from PyQt5.QtCore import QTimer, Qt
 from matplotlib import animation
 from matplotlib.ticker import AutoLocator
+import numpy as np
 import scipy as sp
 from sys import float_info
 
@@ -84,6 +85,9 @@ class TimeSeries:
         self.ts = []
         self.ys = []
 
+        # incremental fits fed by the data, with their lines
+        self._fits = []
+
         # ----- PLOT PREPARATION ----- #
         if axes:
             self.ax = axes
@@ -108,6 +112,24 @@ class TimeSeries:
         self.ax.xaxis.set_major_formatter(self._tick_formatter)
         self.ax.yaxis.set_major_formatter(self._tick_formatter)
 
+    def attach(self, fit, fmt="r--", res=200):
+        """
+        Feeds all points added from now on to fit and draws its curve over the data.
+
+        Parameters
+        ----------
+        fit : science.basics.IncrementalFit or similar
+            Object with add_points(ts, ys) method and params attribute (None while not
+            fitted), called with array of t values returns the curve.
+        fmt : str
+            Format of the fit line.
+        res : int
+            Number of points of the fit line.
+        """
+
+        line, = self.ax.plot([], [], fmt, lw=1)
+        self._fits.append((fit, line, res))
+
     def add_point(self, t, y):
         """ 
         Adds point [t, y] to the line. If lazy_threshold is a number, the data are stored until
@@ -172,6 +194,12 @@ class TimeSeries:
 
         self.l.set_data(self.ts, self.ys)
 
+        for fit, line, res in self._fits:
+            fit.add_points(ts, ys)
+            if fit.params is not None:
+                fit_ts = np.linspace(self.ts[0], self.ts[-1], res)
+                line.set_data(fit_ts, fit(fit_ts))
+
         # first or second call of this method
         if self.left_tlim is None:
 
@@ -2,9 +2,16 @@ from custom_utils.science.imports import *
 
 from scipy.interpolate import UnivariateSpline as _UnivariateSpline
 from scipy.optimize import curve_fit as _curve_fit
+from collections import deque
+from functools import partial
+import inspect
+import time
 import warnings
 
 from custom_utils.science._df_to_table import df_to_booktabs_table
+from custom_utils.mathutils.uncertainty import up_function_array, up_covariance
+from custom_utils.mathutils._parallel import map_bounded
+from custom_utils.mathutils import RunningMoments
 
 __version__ = "2.0"
 
@@ -69,14 +76,47 @@ def repeated_measurement_mean_and_error(values):
     mean_error : float
         error of the mean, eg. std (ddof=1) of values divided by sqrt of number of values
     """
-    array = sp.array(values)
+    array = np.array(values)
     mean = array.mean()
     single_value_error = array.std(ddof=1)
-    mean_error = single_value_error / sp.sqrt(len(array))
+    mean_error = single_value_error / np.sqrt(len(array))
 
     return mean, mean_error
 
 
+def dataframe_up_function(df, f, columns, uncertainty_columns, result=None,
+                          result_uncertainty=None, **kwargs):
+    """
+    Propagates uncertainties through f for every row of dataframe at once,
+    see mathutils.uncertainty.up_function_array.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    f : callable, N arguments
+    columns : N-sequence of column names
+        columns with the arguments of f
+    uncertainty_columns : N-sequence of column names or scalars
+        columns with the uncertainties, scalar means the same uncertainty for all rows
+    result, result_uncertainty : str, optional
+        if passed, the values and uncertainties are stored in df under these names
+
+    Returns
+    -------
+    values, uncertainties : pandas.Series
+    """
+
+    uncertainties = [df[u] if isinstance(u, str) else u for u in uncertainty_columns]
+    values, errors = up_function_array(f, [df[c] for c in columns], uncertainties, **kwargs)
+
+    if result is not None:
+        df[result] = values
+    if result_uncertainty is not None:
+        df[result_uncertainty] = errors
+
+    return values, errors
+
+
 def f_line(x, a, b):
     """
     Simple line function, intended for ls regression.
@@ -102,28 +142,358 @@ def f_exp(x, a, b, c, d):
     """
     Exponential function with translation, intended for ls regression.
     """
-    return a * sp.exp(b * (x + c)) + d
+    return a * np.exp(b * (x + c)) + d
 
 
 def f_exp_simple(x, a, b):
     """
     Exponential function without translation, intended for ls regression.
     """
-    return a * sp.exp(b * x)
+    return a * np.exp(b * x)
 
 
 def f_gaussian(x, h, mu, sigma, dy):
     """
     Gaussian curve. Intended for ls regression.
     """
-    return h * sp.exp(-(x - mu)**2 / (2 * sigma**2)) + dy
+    return h * np.exp(-(x - mu)**2 / (2 * sigma**2)) + dy
 
 
 def f_sin(x, amp, omega, phi, dy):
     """
     Sinus curve. Intended for ls regression.
     """
-    return amp * sp.sin(omega * x + phi) + dy
+    return amp * np.sin(omega * x + phi) + dy
+
+
+def _columns(x, *columns):
+    """ (M, N) jacobian with the derivatives (arrays or scalars) as columns. """
+
+    jac = np.empty((len(columns),) + np.shape(x))
+    for i, column in enumerate(columns):
+        jac[i] = column
+    return np.moveaxis(jac, 0, -1)
+
+
+def _jac_exp(x, a, b, c, d):
+
+    e = np.exp(b * (x + c))
+    return _columns(x, e, a * (x + c) * e, a * b * e, 1)
+
+
+def _jac_exp_simple(x, a, b):
+
+    e = np.exp(b * x)
+    return _columns(x, e, a * x * e)
+
+
+def _jac_gaussian(x, h, mu, sigma, dy):
+
+    g = np.exp(-(x - mu)**2 / (2 * sigma**2))
+    dmu = h * g * (x - mu) / sigma**2
+    return _columns(x, g, dmu, dmu * (x - mu) / sigma, 1)
+
+
+def _jac_sin(x, amp, omega, phi, dy):
+
+    s, c = np.sin(omega * x + phi), np.cos(omega * x + phi)
+    return _columns(x, s, amp * x * c, amp * c, 1)
+
+
+def _sorted_data(xdata, ydata):
+
+    x, y = np.ravel(xdata).astype(float), np.ravel(ydata).astype(float)
+    order = np.argsort(x)
+    return x[order], y[order]
+
+
+def _exponential_amplitude(x, y, b):
+    """ Least squares a, d of a * exp(b * x) + d for fixed b. """
+
+    # relative to the largest exponential, which can not overflow
+    x0 = x.max() if b > 0 else x.min()
+    design = np.stack([np.exp(b * (x - x0)), np.ones_like(x)], axis=1)
+    (a, d), *_ = np.linalg.lstsq(design, y, rcond=None)
+    return a * np.exp(-b * x0), d
+
+
+def _p0_exp(xdata, ydata):
+
+    x, y = _sorted_data(xdata, ydata)
+
+    # means of three equally wide thirds of the x range, their differences have
+    # ratio exp(b * width / 3)
+    width = x[-1] - x[0]
+    thirds = np.minimum((3 * (x - x[0]) / width).astype(int), 2)
+    means = [y[thirds == i].mean() if np.any(thirds == i) else np.nan for i in range(3)]
+    ratio = (means[2] - means[1]) / (means[1] - means[0])
+
+    b = 3 * np.log(ratio) / width if np.isfinite(ratio) and ratio > 0 else 1 / width
+    a, d = _exponential_amplitude(x, y, b)
+    return [a, b, 0, d]
+
+
+def _p0_exp_simple(xdata, ydata):
+
+    x, y = _sorted_data(xdata, ydata)
+
+    sign = np.sign(np.median(y)) or 1
+    positive = sign * y > 0
+    if positive.sum() < 2:
+        return [y.mean() or 1, 0]
+
+    b, log_a = np.polyfit(x[positive], np.log(sign * y[positive]), 1)
+    return [sign * np.exp(log_a), b]
+
+
+def _p0_gaussian(xdata, ydata):
+
+    x, y = _sorted_data(xdata, ydata)
+
+    dy = np.median(y)
+    peak = np.argmax(np.abs(y - dy))
+    h, mu = y[peak] - dy, x[peak]
+
+    weights = np.clip((y - dy) * np.sign(h), 0, None)
+    sigma = np.sqrt(np.sum(weights * (x - mu)**2) / np.sum(weights))
+    if not sigma > 0:
+        sigma = (x[-1] - x[0]) / 10
+    return [h, mu, sigma, dy]
+
+
+def _p0_sin(xdata, ydata):
+
+    x, y = _sorted_data(xdata, ydata)
+
+    # strongest frequency of the data resampled to uniform grid
+    uniform = np.linspace(x[0], x[-1], len(x))
+    spectrum = np.abs(np.fft.rfft(np.interp(uniform, x, y) - y.mean()))
+    frequencies = np.fft.rfftfreq(len(x), uniform[1] - uniform[0])
+    omega = 2 * np.pi * frequencies[1 + np.argmax(spectrum[1:])]
+
+    # amp * sin(omega * x + phi) = A * sin(omega * x) + B * cos(omega * x)
+    design = np.stack([np.sin(omega * x), np.cos(omega * x), np.ones_like(x)], axis=1)
+    (a, b, dy), *_ = np.linalg.lstsq(design, y, rcond=None)
+    return [np.hypot(a, b), omega, np.arctan2(b, a), dy]
+
+
+# analytic jacobians jac(x, *params) -> (M, N) array, passed to curve_fit
+_JACOBIANS = {
+    f_exp: _jac_exp,
+    f_exp_simple: _jac_exp_simple,
+    f_gaussian: _jac_gaussian,
+    f_sin: _jac_sin,
+}
+
+# initial guesses of the parameters from the data, p0(xdata, ydata) -> N-sequence
+_INITIAL_GUESSES = {
+    f_exp: _p0_exp,
+    f_exp_simple: _p0_exp_simple,
+    f_gaussian: _p0_gaussian,
+    f_sin: _p0_sin,
+}
+
+
+def register_model(f, jac=None, p0=None):
+    """
+    Registers analytic jacobian and initial guess heuristic of model f(x, param1, param2, ...),
+    FitCurve uses them automatically for f unless jac or p0 are passed.
+
+    Parameters
+    ----------
+    f: callable
+        The model.
+    jac: callable, optional
+        jac(x, param1, param2, ...) returns (M, N) array of the derivatives of f at M points
+        x with respect to the N parameters.
+    p0: callable, optional
+        p0(xdata, ydata) returns N-sequence, initial guess of the parameters.
+    """
+    if jac is not None:
+        _JACOBIANS[f] = jac
+    if p0 is not None:
+        _INITIAL_GUESSES[f] = p0
+
+
+# models linear in their parameters, fitted in closed form, with their numbers of parameters
+_LINEAR_MODELS = {f_line: 2, f_para: 3, f_cubic: 4}
+
+_CURVE_FIT_SIGNATURE = inspect.signature(_curve_fit)
+
+# arguments of curve_fit the closed form solution handles, others are passed to curve_fit
+_LINEAR_FIT_ARGUMENTS = {"f", "xdata", "ydata", "p0", "sigma", "absolute_sigma", "check_finite"}
+
+
+def _parameter_count(f, p0):
+    """ Number of parameters of model f(x, param1, param2, ...), like in curve_fit. """
+
+    if p0 is not None:
+        return np.size(p0)
+    if f in _LINEAR_MODELS:
+        return _LINEAR_MODELS[f]
+
+    parameters = list(inspect.signature(f).parameters.values())
+    if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+        raise ValueError("Unable to determine number of fit parameters, provide p0.")
+
+    return len(parameters) - 1
+
+
+def _design(f, xdata, out):
+    """
+    Fills out (M x N) with the design matrix of model f linear in its N parameters, its columns
+    are the model with unit parameter vectors, powers of x for the built-in polynomials.
+    """
+
+    n = out.shape[1]
+    if f in _LINEAR_MODELS:
+        x = np.ravel(np.asarray(xdata, dtype=float))
+        out[:, n - 1] = 1
+        for i in range(n - 2, -1, -1):
+            np.multiply(out[:, i + 1], x, out=out[:, i])
+    else:
+        for i, row in enumerate(np.eye(n)):
+            out[:, i] = f(xdata, *row)
+
+    return out
+
+
+def _linear_fit(f, xdata, ydata, p0=None, sigma=None, absolute_sigma=False, check_finite=True):
+    """
+    Weighted least squares fit of model f(x, param1, param2, ...) linear in its parameters,
+    solved in closed form by QR decomposition. params and cov are the same as curve_fit would
+    return, including the scaling of cov by the reduced chi squared if not absolute_sigma.
+    Returns None if the design matrix is rank deficient, the fit is then left to curve_fit.
+    """
+
+    as_array = np.asarray_chkfinite if check_finite else np.asarray
+    ydata = as_array(ydata, dtype=float).ravel()
+    n, m = _parameter_count(f, p0), len(ydata)
+    if n > m:
+        raise TypeError(f"The number of func parameters={n} must not exceed the number of "
+                        f"data points={m}")
+
+    # design matrix with ydata as the last column
+    system = np.empty((m, n + 1), order="F")
+    _design(f, xdata, system[:, :n])
+    if check_finite:
+        np.asarray_chkfinite(system[:, :n])
+    system[:, n] = ydata
+
+    if sigma is not None:
+        system *= 1 / np.broadcast_to(np.asarray(sigma, dtype=float), (m,))[:, np.newaxis]
+
+    # columns normalised to unit norm, so that the rank test does not depend on the units of x
+    scale = np.linalg.norm(system[:, :n], axis=0)
+    if not np.all(scale > 0):
+        return None
+    system[:, :n] /= scale
+
+    # r = [[R, Q.T @ y], [0, norm of residuals]], Q is never formed
+    r = np.linalg.qr(system, mode="r")
+    diagonal = np.abs(np.diag(r)[:n])
+    if diagonal.min() <= diagonal.max() * max(m, n) * np.finfo(float).eps:
+        return None
+
+    r_inverse = np.linalg.inv(r[:n, :n]) / scale[:, np.newaxis]
+    params = r_inverse @ r[:n, n]
+    cov = r_inverse @ r_inverse.T
+
+    if not absolute_sigma:
+        if m > n:
+            cov *= r[n, n]**2 / (m - n)
+        else:
+            cov.fill(np.inf)
+
+    return params, cov
+
+
+def _closed_form(f, linear, arguments):
+    """ Whether fit of f with curve_fit arguments (dict by name) is solved by _linear_fit. """
+
+    if linear is None:
+        linear = f in _LINEAR_MODELS
+
+    return (linear and set(arguments) <= _LINEAR_FIT_ARGUMENTS
+            and np.ndim(arguments.get("sigma")) < 2)
+
+
+def _fit(f, xdata, ydata, *args, linear=None, **kwargs):
+    """ Fits f like FitCurve, returns (params, cov). """
+
+    arguments = _CURVE_FIT_SIGNATURE.bind(f, xdata, ydata, *args, **kwargs).arguments
+    if _closed_form(f, linear, arguments):
+        result = _linear_fit(**arguments)
+        if result is not None:
+            return result
+
+    if f in _JACOBIANS and "jac" not in arguments:
+        kwargs["jac"] = _JACOBIANS[f]
+    if f in _INITIAL_GUESSES and "p0" not in arguments and "bounds" not in arguments:
+        kwargs["p0"] = _INITIAL_GUESSES[f](xdata, ydata)
+    return _curve_fit(f, xdata, ydata, *args, **kwargs)
+
+
+def _resample_moments(f, xdata, ydata, samples, params, options):
+    """
+    Fits f to resampled data, samples are index arrays of the data points. Returns
+    RunningMoments of the fitted params and the number of failed fits.
+    """
+
+    options = dict(options, p0=params)
+    linear = options.pop("linear")
+    sigma = options.get("sigma")
+    if sigma is not None:
+        sigma = np.asarray(sigma)
+    xdata = np.asarray(xdata)
+
+    # linear models skip the dispatch of _fit, unless the resampled design is rank deficient
+    if _closed_form(f, linear, dict(options, f=f, xdata=xdata, ydata=ydata)):
+        def solve(*args, **kwargs):
+            result = _linear_fit(*args, **kwargs)
+            return result if result is not None else _fit(*args, linear=False, **kwargs)
+    else:
+        solve = partial(_fit, linear=linear)
+
+    fits = []
+    failed = 0
+    for indices in samples:
+        if np.ndim(sigma) == 1:
+            options["sigma"] = sigma[indices]
+        elif np.ndim(sigma) == 2:
+            options["sigma"] = sigma[np.ix_(indices, indices)]
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                fit_params, _ = solve(f, xdata[..., indices], ydata[indices], **options)
+        except (RuntimeError, ValueError):
+            failed += 1
+            continue
+
+        if np.all(np.isfinite(fit_params)):
+            fits.append(fit_params)
+        else:
+            failed += 1
+
+    moments = RunningMoments()
+    moments.update(np.reshape(fits, (len(fits), len(params))))
+    return moments, failed
+
+
+def _bootstrap_chunk(f, xdata, ydata, n, seed, params, options):
+
+    rng = np.random.default_rng(seed)
+    m = len(ydata)
+    samples = (rng.integers(0, m, m) for _ in range(n))
+    return _resample_moments(f, xdata, ydata, samples, params, options)
+
+
+def _jackknife_chunk(f, xdata, ydata, start, stop, params, options):
+
+    m = len(ydata)
+    samples = (np.delete(np.arange(m), i) for i in range(start, stop))
+    return _resample_moments(f, xdata, ydata, samples, params, options)
 
 
 class FitCurve:
@@ -144,25 +514,263 @@ class FitCurve:
         Initial guess for the parameters.
     sigma: None or M-length sequence
         Determines the uncertainty of ydata.
+    jac: None or callable
+        Jacobian of f with respect to the parameters, the analytic one of built-in models
+        (or models added by register_model) is used by default. Built-in models also guess
+        p0 from the data if neither p0 nor bounds are passed.
+    linear: None or bool
+        If f is linear in its parameters, it is fitted by a closed form weighted least squares
+        solution instead of the iterative curve_fit, with the same params and cov. None
+        detects the built-in f_line, f_para and f_cubic, True declares any f linear.
+        Options the closed form doesn't support (bounds, method, 2-D sigma, ...) fall back
+        to curve_fit.
     """
 
-    def __init__(self, f, xdata, ydata, *args, **kwargs):
-        params, cov = _curve_fit(f, xdata, ydata, *args, **kwargs)
-        errors = [sp.sqrt(cov[i, i]) for i in range(len(cov))]
+    def __init__(self, f, xdata, ydata, *args, linear=None, **kwargs):
+        params, cov = _fit(f, xdata, ydata, *args, linear=linear, **kwargs)
+        errors = [np.sqrt(cov[i, i]) for i in range(len(cov))]
 
-        if len(sp.where(cov == sp.inf)[0]) > 0:
+        if len(np.where(cov == np.inf)[0]) > 0:
             raise ValueError(
                 "Fit unsuccessful, provide better initial parameters (p0)")
 
         self.params = params
         self.errors = errors
-        self.xdata = sp.array(xdata)
-        self.ydata = sp.array(ydata)
+        self.cov = cov
+        self.model = f
+        self.xdata = np.array(xdata)
+        self.ydata = np.array(ydata)
         self.f = lambda x: f(x, *params)
 
+        # options of the fit by name, for refitting resampled data
+        arguments = _CURVE_FIT_SIGNATURE.bind(f, xdata, ydata, *args, **kwargs).arguments
+        self._options = dict(arguments.pop("kwargs", {}), linear=linear)
+        self._options.update((k, v) for k, v in arguments.items()
+                             if k not in ("f", "xdata", "ydata"))
+
     def __call__(self, x):
         return self.f(x)
 
+    def _resample(self, chunk, tasks, workers, time_budget):
+        """ Merges moments of resampled params returned by chunk for tasks. """
+        moments = RunningMoments()
+        start = time.perf_counter()
+
+        tasks = ((self.model, self.xdata, self.ydata) + task + (self.params, self._options)
+                 for task in tasks)
+        for chunk_moments, _ in map_bounded(chunk, tasks, workers):
+            moments.merge(chunk_moments)
+            if time_budget is not None and time.perf_counter() - start > time_budget:
+                break
+
+        if moments.count < 2:
+            raise ValueError("Fits of less than 2 resampled datasets succeeded.")
+        return moments
+
+    @classmethod
+    def reduced(cls, f, xdata, ydata, sigma=None, size=10000, method="bin", compare=False,
+                chunk_size=1_000_000, seed=None, **kwargs):
+        """
+        Fits f to data reduced by reduce_data, for inputs of millions of points, which can be
+        numpy.memmap arrays.
+
+        Parameters
+        ----------
+        f, xdata, ydata, sigma: see FitCurve
+        size, method, chunk_size, seed: see reduce_data
+        compare: bool
+            Also fit the full data and store the comparison in reduction attribute.
+        kwargs:
+            Other arguments of FitCurve.
+
+        Returns
+        -------
+        FitCurve
+            Fit of the reduced data. Its reduction attribute is dict with "points" (number of
+            reduced points), "time" (of reduction and fit) and with compare also "full_time",
+            "speedup", "error_ratio" (errors divided by errors of the full fit) and "shift"
+            (difference of params from the full fit in units of its errors).
+        """
+        start = time.perf_counter()
+        x, y, reduced_sigma = reduce_data(xdata, ydata, sigma, size, method, chunk_size, seed)
+        if reduced_sigma is not None:
+            kwargs["sigma"] = reduced_sigma
+        fit = cls(f, x, y, **kwargs)
+        fit.reduction = {"points": len(y), "time": time.perf_counter() - start}
+
+        if compare:
+            if sigma is not None:
+                kwargs["sigma"] = np.broadcast_to(np.asarray(sigma, dtype=float), np.shape(ydata))
+            else:
+                kwargs.pop("sigma", None)
+
+            start = time.perf_counter()
+            full = cls(f, np.asarray(xdata), np.asarray(ydata), **kwargs)
+            full_time = time.perf_counter() - start
+
+            full_errors = np.asarray(full.errors)
+            fit.reduction.update(
+                full_time=full_time,
+                speedup=full_time / fit.reduction["time"],
+                error_ratio=np.asarray(fit.errors) / full_errors,
+                shift=(fit.params - full.params) / full_errors,
+            )
+
+        return fit
+
+    def bootstrap(self, n=1000, workers=None, chunk_size=100, time_budget=None, seed=None):
+        """
+        Estimates errors of the parameters by bootstrap, std of params fitted to n datasets
+        resampled with replacement. The fits start from params and use the same options
+        (closed form for linear models), failed fits are skipped.
+
+        Parameters
+        ----------
+        n: int
+            Number of resampled datasets.
+        workers: None, int or concurrent.futures.Executor
+            None fits in this process, int is the number of worker processes.
+        chunk_size: int
+            Number of fits done by one task.
+        time_budget: None or float
+            Seconds after which no more chunks are collected, the errors are estimated
+            from the finished fits.
+        seed: None, int or numpy.random.SeedSequence
+
+        Returns
+        -------
+        errors: ndarray
+            Bootstrap errors of the parameters.
+        count: int
+            Number of successful fits the errors come from.
+        """
+        sizes = [chunk_size] * (n // chunk_size)
+        if n % chunk_size:
+            sizes.append(n % chunk_size)
+
+        seed_sequence = seed if isinstance(seed, np.random.SeedSequence) \
+            else np.random.SeedSequence(seed)
+        tasks = zip(sizes, seed_sequence.spawn(len(sizes)))
+
+        moments = self._resample(_bootstrap_chunk, tasks, workers, time_budget)
+        return moments.std(), moments.count
+
+    def jackknife(self, workers=None, chunk_size=100, time_budget=None):
+        """
+        Estimates errors of the parameters by jackknife, from params fitted to the data
+        without one point, for all points, sqrt((M - 1) / M * sum((params_i - mean)**2)).
+        See bootstrap for the parameters, with time_budget only part of the points
+        is left out.
+
+        Returns
+        -------
+        errors: ndarray
+            Jackknife errors of the parameters.
+        count: int
+            Number of successful fits the errors come from.
+        """
+        m = len(self.ydata)
+        tasks = ((start, min(start + chunk_size, m)) for start in range(0, m, chunk_size))
+
+        moments = self._resample(_jackknife_chunk, tasks, workers, time_budget)
+        return np.sqrt(moments.variance(ddof=0) * (moments.count - 1)), moments.count
+
+    @classmethod
+    def multistart(cls, f, xdata, ydata, n_starts=16, bounds=None, p0=None, good_enough=None,
+                   workers=None, seed=None, **kwargs):
+        """
+        Fits f from many initial guesses and keeps the best converged fit (lowest chi
+        squared), for models with local minima or unknown p0. The starts are p0, the guess of
+        registered models (see register_model) and n_starts points of a latin hypercube
+        over bounds, they are fitted in this order, in parallel with workers.
+
+        Parameters
+        ----------
+        f, xdata, ydata: see FitCurve
+        n_starts: int
+            Number of latin hypercube starts.
+        bounds: None or (N-length sequence, N-length sequence)
+            Bounds of the parameters, also passed to curve_fit. Infinite bounds (or no bounds)
+            are replaced by +- 2 * max(|guess|, 1) around the guess (or ones) for the
+            hypercube.
+        p0: None or N-length sequence
+            Initial guess tried first.
+        good_enough: None or float
+            Stop when a fit with reduced chi squared (weighted by sigma) at most good_enough
+            is found.
+        workers: None, int or concurrent.futures.Executor
+            None fits in this process, int is the number of worker processes.
+        seed: None, int or numpy.random.SeedSequence
+            Seed of the hypercube.
+        kwargs:
+            Other arguments of FitCurve.
+
+        Returns
+        -------
+        FitCurve
+        """
+        n = _parameter_count(f, p0)
+        if bounds is not None:
+            kwargs["bounds"] = bounds
+            lower, upper = (np.broadcast_to(np.asarray(b, dtype=float), (n,)) for b in bounds)
+        else:
+            lower, upper = np.full(n, -np.inf), np.full(n, np.inf)
+
+        starts = [] if p0 is None else [np.asarray(p0, dtype=float)]
+        if f in _INITIAL_GUESSES:
+            try:
+                starts.append(np.asarray(_INITIAL_GUESSES[f](xdata, ydata), dtype=float))
+            except (ValueError, FloatingPointError, np.linalg.LinAlgError):
+                pass
+
+        center = starts[0] if starts else np.ones(n)
+        center = np.where(np.isfinite(center), center, 1)
+        width = 2 * np.maximum(np.abs(center), 1)
+        low = np.where(np.isfinite(lower), lower, np.minimum(center - width, upper - 2 * width))
+        high = np.where(np.isfinite(upper), upper, np.maximum(center + width, low + 2 * width))
+
+        # latin hypercube, one start in every of n_starts slices of every parameter
+        rng = np.random.default_rng(seed)
+        slices = np.argsort(rng.random((n_starts, n)), axis=0) + rng.random((n_starts, n))
+        starts.extend(low + (high - low) * slices / n_starts)
+
+        tasks = ((f, xdata, ydata, np.clip(start, lower, upper), kwargs) for start in starts)
+        best = None
+        for result in map_bounded(_fit_start, tasks, workers):
+            if result is not None and (best is None or result[1] < best[1]):
+                best = result
+            if best is not None and good_enough is not None and best[1] <= good_enough:
+                break
+
+        if best is None:
+            raise ValueError(
+                "Fit unsuccessful, none of {} initial parameters converged".format(len(starts)))
+
+        return cls(f, xdata, ydata, p0=best[0], **kwargs)
+
+    def confidence_band(self, x, method="auto"):
+        """
+        Calculates values of the fit and their uncertainties given by the covariance of
+        the parameters, J @ cov @ J.T, for all x in one call.
+
+        Parameters
+        ----------
+        x: float or sequence
+            X values to evaluate the fit at.
+        method: "auto", "ad" or "fd"
+            How to differentiate the model, see mathutils.uncertainty.up_function.
+
+        Returns
+        -------
+        ys: ndarray
+            Values of the fit at x.
+        uncertainties: ndarray
+            One sigma uncertainties of ys, the band is ys +- uncertainties.
+        """
+        x = np.asarray(x, dtype=float)
+        return up_covariance(lambda *params: self.model(x, *params), self.params, self.cov,
+                             method=method)
+
     def curve(self, start=None, end=None, res=100, overrun=0):
         """
         Calculates the curve of the fit, used as line of theoretical function.
@@ -193,12 +801,468 @@ class FitCurve:
             start -= overrun * interval_length
             end += overrun * interval_length
 
-        xes = sp.linspace(start, end, res)
+        xes = np.linspace(start, end, res)
         ys = self(xes)
 
         return xes, ys
 
 
+def _chunks(length, chunk_size):
+
+    return (slice(start, min(start + chunk_size, length))
+            for start in range(0, length, chunk_size))
+
+
+def reduce_data(xdata, ydata, sigma=None, size=10000, method="bin", chunk_size=1_000_000,
+                seed=None):
+    """
+    Reduces large dataset to about size points before fitting. The data are read in chunks
+    of chunk_size, so they can be numpy.memmap arrays larger than memory.
+
+    Parameters
+    ----------
+    xdata, ydata: M-length arrays
+    sigma: None, float or M-length array
+        Uncertainties of ydata.
+    size: int
+        Number of bins or of the points kept.
+    method: "bin", "uniform" or "stratified"
+        "bin" averages points in size equally wide bins of x, weighted by 1 / sigma**2,
+        the sigma of the mean is 1 / sqrt(sum(1 / sigma**2)), without sigma it is
+        1 / sqrt(number of points), which gives the bins the right relative weights (curve_fit
+        without absolute_sigma). Empty bins are left out, curvature of the model within
+        a bin biases the fit, so the bins have to be narrow compared to the features.
+        "uniform" keeps every (M / size)-th point, "stratified" keeps one randomly chosen
+        point from each of size runs of consecutive points.
+    chunk_size: int
+    seed: None, int or numpy.random.SeedSequence
+        Seed of "stratified".
+
+    Returns
+    -------
+    xdata, ydata, sigma: ndarrays
+        Reduced data, sigma is None if not passed and not binned.
+    """
+    m = len(ydata)
+
+    if method in ("uniform", "stratified"):
+        if method == "uniform":
+            indices = slice(None, None, max(m // size, 1))
+        else:
+            rng = np.random.default_rng(seed)
+            bounds = np.linspace(0, m, min(size, m) + 1).astype(int)
+            indices = bounds[:-1] + (rng.random(len(bounds) - 1) * np.diff(bounds)).astype(int)
+
+        x, y = np.array(xdata[indices]), np.array(ydata[indices])
+        if sigma is not None:
+            # scalar sigma is kept for the points, it matters with absolute_sigma
+            sigma = np.full(len(y), float(sigma)) if np.isscalar(sigma) \
+                else np.array(sigma[indices])
+        return x, y, sigma
+
+    if method != "bin":
+        raise ValueError('Value of method must be "bin", "uniform" or "stratified".')
+
+    low = min(np.min(xdata[chunk]) for chunk in _chunks(m, chunk_size))
+    high = max(np.max(xdata[chunk]) for chunk in _chunks(m, chunk_size))
+    width = (high - low) / size or 1
+
+    # sums of weights, weighted x and y and counts in the bins
+    sums = np.zeros((4, size))
+    for chunk in _chunks(m, chunk_size):
+        x = np.asarray(xdata[chunk], dtype=float)
+        y = np.asarray(ydata[chunk], dtype=float)
+        if sigma is None:
+            weights = np.ones_like(y)
+        else:
+            weights = 1 / np.broadcast_to(np.asarray(
+                sigma if np.isscalar(sigma) else sigma[chunk], dtype=float), y.shape)**2
+
+        bins = np.minimum(((x - low) / width).astype(int), size - 1)
+        for row, values in zip(sums, (weights, weights * x, weights * y, np.ones_like(y))):
+            row += np.bincount(bins, values, minlength=size)
+
+    # empty bins are left out
+    weights, x, y, counts = sums[:, sums[3] > 0]
+    binned_sigma = 1 / np.sqrt(counts if sigma is None else weights)
+
+    return x / weights, y / weights, binned_sigma
+
+
+def _fit_start(f, xdata, ydata, p0, kwargs):
+    """ Fits f from p0, returns (params, reduced chi squared) or None if the fit fails. """
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            fit = FitCurve(f, xdata, ydata, p0=p0, **kwargs)
+    except (RuntimeError, ValueError):
+        return None
+
+    sigma = kwargs.get("sigma")
+    residuals = (fit.ydata - fit(fit.xdata)) / (1 if sigma is None else np.asarray(sigma))
+    chi_squared = np.sum(residuals**2) / max(residuals.size - len(fit.params), 1)
+
+    return fit.params, chi_squared if np.isfinite(chi_squared) else np.inf
+
+
+def _fit_chunk(f, datasets, p0, warm_start, kwargs):
+    """
+    Fits f to consecutive datasets (x, y, sigma), returns list of (params, errors, status).
+    With warm_start, every fit starts from the params of the previous successful one,
+    if it fails, it is repeated from p0.
+    """
+
+    results = []
+    previous = None
+    for x, y, sigma in datasets:
+        options = dict(kwargs)
+        if sigma is not None:
+            options["sigma"] = np.broadcast_to(sigma, np.shape(y))
+
+        starts = [previous, p0] if warm_start and previous is not None else [p0]
+        for start in starts:
+            options.pop("p0", None)
+            if start is not None:
+                options["p0"] = start
+
+            try:
+                fit = FitCurve(f, x, y, **options)
+            except Exception as e:
+                status = f"{type(e).__name__}: {e}"
+            else:
+                previous = fit.params
+                results.append((fit.params, fit.errors, "ok"))
+                break
+        else:
+            results.append((None, None, status))
+
+    return results
+
+
+def _datasets(xdata, ydata, sigma):
+    """ List of (x, y, sigma) from 1-D or 2-D arrays or sequences of arrays. """
+
+    def rows(data, k):
+        if data is None or np.isscalar(data):
+            return [data] * k
+        if len(data) and np.ndim(data[0]) == 0:
+            # one row shared by all datasets
+            return [np.asarray(data)] * k
+        return list(data)
+
+    k = len(ydata)
+    datasets = list(zip(rows(xdata, k), list(ydata), rows(sigma, k)))
+    if len(datasets) != k:
+        raise ValueError("xdata and sigma have to have one row for every row of ydata.")
+    return datasets
+
+
+def fit_batch(f, xdata, ydata, sigma=None, p0=None, warm_start=True, workers=None, chunk_size=64,
+              **kwargs):
+    """
+    Fits f to many datasets, e.g. spectra, by FitCurve. The datasets are split into chunks of
+    consecutive ones, which are fitted in parallel worker processes. Failed fits don't
+    stop the batch, they are reported in status.
+
+    Parameters
+    ----------
+    f: callable
+        Model f(x, param1, param2, ...), has to be picklable for worker processes (defined
+        at module level), otherwise threads are used.
+    xdata: M-length sequence or K x M array (or K sequences)
+        X values, shared by all datasets or one row per dataset.
+    ydata: K x M array or K sequences
+        Y values, one row per dataset, the rows can have different lengths.
+    sigma: None, M-length sequence or K x M array (or K sequences)
+        Uncertainties of ydata.
+    p0: None or N-length sequence
+        Initial guess of the parameters, see FitCurve.
+    warm_start: bool
+        Start every fit from the result of the previous one in the chunk, useful if the
+        datasets are ordered and change gradually. If such fit fails, it is repeated from p0.
+    workers: None, int or concurrent.futures.Executor
+        None fits in this process, int is the number of worker processes.
+    chunk_size: int
+        Number of datasets fitted by one task.
+    kwargs:
+        Other arguments of FitCurve (bounds, linear, method, ...).
+
+    Returns
+    -------
+    params: K x N ndarray
+        Fitted parameters, nan for failed fits.
+    errors: K x N ndarray
+        Errors of the parameters, nan for failed fits.
+    status: K-length ndarray of str
+        "ok" or the error message of the failed fit.
+    """
+    datasets = _datasets(xdata, ydata, sigma)
+    n = _parameter_count(f, p0)
+
+    tasks = ((f, datasets[i:i + chunk_size], p0, warm_start, kwargs)
+             for i in range(0, len(datasets), chunk_size))
+    results = [result for chunk in map_bounded(_fit_chunk, tasks, workers) for result in chunk]
+
+    params = np.full((len(datasets), n), np.nan)
+    errors = np.full((len(datasets), n), np.nan)
+    status = np.empty(len(datasets), dtype=object)
+    for i, (fit_params, fit_errors, fit_status) in enumerate(results):
+        if fit_params is not None:
+            params[i], errors[i] = fit_params, fit_errors
+        status[i] = fit_status
+
+    return params, errors, status.astype(str)
+
+
+def dataframe_fit_batch(grouped, f, x, y, sigma=None, **kwargs):
+    """
+    Fits f to every group of grouped dataframe, see fit_batch.
+
+    Parameters
+    ----------
+    grouped: pandas.core.groupby.DataFrameGroupBy
+        E.g. df.groupby("spectrum").
+    f: callable
+    x, y: column names
+    sigma: None, column name or scalar
+    kwargs:
+        Other arguments of fit_batch.
+
+    Returns
+    -------
+    params, errors: pandas.DataFrame
+        Indexed by the group keys, columns are named by the parameters of f.
+    status: pandas.Series
+    """
+    keys, groups = zip(*grouped)
+    params, errors, status = fit_batch(
+        f, [group[x].to_numpy() for group in groups], [group[y].to_numpy() for group in groups],
+        [group[sigma].to_numpy() for group in groups] if isinstance(sigma, str) else sigma,
+        **kwargs
+    )
+
+    names = list(inspect.signature(f).parameters)[1:]
+    columns = names if len(names) == params.shape[1] else None
+    index = pd.Index(keys)
+
+    return (pd.DataFrame(params, index=index, columns=columns),
+            pd.DataFrame(errors, index=index, columns=columns),
+            pd.Series(status, index=index))
+
+
+class IncrementalFit:
+    """
+    Fit of f updated by incoming data points, e.g. from live acquisition, without refitting
+    the whole history. Models linear in their parameters are updated by recursive least
+    squares, O(N**2) per point, other models are refitted by curve_fit starting from the
+    previous params. Objects are callable, add_points has the signature of
+    matplotlibutils.TimeSeries.add_points, see TimeSeries.attach.
+    The recursive updates work with the information matrix, whose condition number is
+    the square of that of the design matrix, so ill-conditioned linear models (e.g.
+    polynomials far from x = 0 over narrow window) lose precision, shifting x helps.
+
+    Parameters
+    ----------
+    f: callable
+        Model f(x, param1, param2, ...).
+    p0: None or N-length sequence
+        Initial guess of the first fit of nonlinear model.
+    linear: None or bool
+        Whether f is linear in its parameters, see FitCurve.
+    forgetting: float in (0, 1]
+        Weight of older points is multiplied by forgetting with every new point.
+    window: None or int
+        Only the last window points are fitted, exclusive with forgetting.
+    kwargs:
+        Other arguments of FitCurve used by the refits of nonlinear model (bounds, ...).
+
+    Attributes
+    ----------
+    params, cov, errors: ndarray or None
+        Current fit, None until there are enough points. cov is scaled by the reduced chi
+        squared, like by FitCurve without absolute_sigma.
+    count: float
+        Number of fitted points, sum of their weights with forgetting.
+    """
+
+    def __init__(self, f, p0=None, linear=None, forgetting=1, window=None, **kwargs):
+        if not 0 < forgetting <= 1:
+            raise ValueError("Value of forgetting must be in (0, 1].")
+        if window is not None and forgetting < 1:
+            raise ValueError("Window and forgetting can not be used simultaneously.")
+
+        self.model = f
+        self.linear = f in _LINEAR_MODELS if linear is None else linear
+        self.forgetting = forgetting
+        self.window = window
+        self._kwargs = kwargs
+        self._n = _parameter_count(f, p0)
+
+        self._p0 = None if p0 is None else np.asarray(p0, dtype=float)
+        self.params = None
+        self.cov = None
+        self.errors = None
+        self.count = 0
+
+        # points in the fit (all of them for nonlinear model) or waiting for the first fit
+        self._points = deque()
+        self._received = 0
+
+        # recursive least squares, inverse of the information matrix and weighted sum of
+        # squared residuals
+        self._p = None
+        self._rss = 0.0
+        self._removed = 0
+
+    def __call__(self, x):
+        return self.model(x, *self.params)
+
+    def add_point(self, x, y, sigma=None):
+        """ Adds one point, see add_points. """
+        self.add_points([x], [y], None if sigma is None else [sigma])
+
+    def add_points(self, xs, ys, sigma=None):
+        """
+        Adds points and updates the fit.
+
+        Parameters
+        ----------
+        xs: M-length sequence
+        ys: M-length sequence
+        sigma: None, float or M-length sequence
+            Uncertainties of ys, only relative values matter.
+        """
+        xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        sigmas = np.broadcast_to(np.asarray(1 if sigma is None else sigma, dtype=float),
+                                 ys.shape)
+
+        if self.linear:
+            self._update_linear(xs, ys, sigmas)
+        else:
+            self._refit(xs, ys, sigmas)
+
+        if self.cov is not None:
+            self.errors = np.sqrt(np.diag(self.cov))
+
+    def _update_linear(self, xs, ys, sigmas):
+        design = _design(self.model, xs, np.empty((len(ys), self._n)))
+
+        for phi, y, weight in zip(design, ys, 1 / sigmas**2):
+            if self._p is None:
+                self._points.append((phi, y, weight))
+                # points buffered while the params were undetermined are windowed too
+                while self.window is not None and len(self._points) > self.window:
+                    self._points.popleft()
+                self._initialize()
+                continue
+
+            self._p /= self.forgetting
+            self._rss *= self.forgetting
+            self.count *= self.forgetting
+            self._rank_one(phi, y, weight)
+
+            if self.window is not None:
+                self._points.append((phi, y, weight))
+                if len(self._points) > self.window:
+                    old_phi, old_y, old_weight = self._points.popleft()
+                    self._rank_one(old_phi, old_y, -old_weight)
+                    self._removed += 1
+
+                # removals accumulate rounding errors, exact solution once per window
+                if self._removed >= self.window:
+                    self._initialize()
+                    self._removed = 0
+
+        if self._p is not None:
+            dof = self.count - self._n
+            self.cov = self._p * (self._rss / dof if dof > 0 else np.inf)
+
+    def _initialize(self):
+        """ Exact least squares of the points so far, once they determine the params. """
+        phi = np.array([point[0] for point in self._points])
+        y = np.array([point[1] for point in self._points])
+        forgotten = self.forgetting**np.arange(len(y) - 1, -1, -1)
+        weights = np.array([point[2] for point in self._points]) * forgotten
+
+        if len(y) < self._n:
+            return
+
+        # QR of the weighted design matrix, the information matrix is r.T @ r
+        scale = np.sqrt(weights)
+        q, r = np.linalg.qr(phi * scale[:, np.newaxis])
+        diagonal = np.abs(np.diag(r))
+        if diagonal.min() <= np.finfo(float).eps * diagonal.max() * len(y):
+            return
+
+        r_inverse = np.linalg.inv(r)
+        self._p = r_inverse @ r_inverse.T
+        self.params = r_inverse @ (q.T @ (scale * y))
+        self._rss = np.sum(weights * (y - phi @ self.params)**2)
+        self.count = np.sum(forgotten)
+
+        if self.window is None:
+            self._points.clear()
+
+    def _rank_one(self, phi, y, weight):
+        """ Adds point to the recursive least squares, removes it if weight is negative. """
+        p_phi = self._p @ phi
+        denominator = 1 / weight + phi @ p_phi
+        error = y - phi @ self.params
+        gain = p_phi / denominator
+
+        self.params = self.params + gain * error
+        self._p -= np.outer(gain, p_phi)
+        self._rss += error**2 / denominator
+        self.count += 1 if weight > 0 else -1
+
+    def _refit(self, xs, ys, sigmas):
+        for point in zip(xs, ys, sigmas):
+            self._points.append(point + (self._received,))
+            self._received += 1
+
+        if self.window is not None:
+            while len(self._points) > self.window:
+                self._points.popleft()
+
+        # weights of points are forgetting**age, negligible ones are dropped
+        ages = self._received - 1 - np.array([point[3] for point in self._points])
+        weights = self.forgetting**ages
+        while weights[0] < 1e-12:
+            self._points.popleft()
+            weights = weights[1:]
+
+        if len(self._points) < self._n:
+            return
+
+        x, y, sigma, _ = (np.array(column) for column in zip(*self._points))
+        options = dict(self._kwargs, sigma=sigma / np.sqrt(weights))
+
+        # warm start from the previous params, if it fails, from p0 (or guess of the model)
+        starts = [self._p0] if self.params is None else [self.params, self._p0]
+        for start in starts:
+            if start is not None:
+                options["p0"] = start
+            else:
+                options.pop("p0", None)
+
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    params, cov = _fit(self.model, x, y, linear=False, **options)
+            except (RuntimeError, ValueError) as e:
+                error = e
+                continue
+
+            if np.all(np.isfinite(cov)):
+                self.params, self.cov = params, cov
+                self.count = np.sum(weights)
+                return
+            error = "infinite covariance"
+
+        warnings.warn("IncrementalFit: refit failed, keeping previous parameters ({})".format(error))
+
+
 class Spline(_UnivariateSpline):
     """
     Thin wrapper around the scipy's UnivariateSpline. Original data is saved in xdata, ydata.
@@ -229,8 +1293,8 @@ class Spline(_UnivariateSpline):
             else:
                 raise e
 
-        self.xdata = sp.array(x)
-        self.ydata = sp.array(y)
+        self.xdata = np.array(x)
+        self.ydata = np.array(y)
 
     def curve(self, start=None, end=None, res=100, overrun=0):
         """
@@ -263,7 +1327,7 @@ class Spline(_UnivariateSpline):
             start -= overrun * interval_length
             end += overrun * interval_length
 
-        xes = sp.linspace(start, end, res)
+        xes = np.linspace(start, end, res)
         ys = self(xes)
 
         return xes, ys
@@ -297,7 +1361,7 @@ class Spline(_UnivariateSpline):
                 new_y.append(y)
                 highest = x
 
-        return sp.array(new_x), sp.array(new_y)
+        return np.array(new_x), np.array(new_y)
 
 
 def main():